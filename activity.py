@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict
+from pymongo import UpdateOne
+from config import ACTIVITY_FLUSH_INTERVAL
+from database import users_col
+from logsink import sink
+import stats
+
+logger = logging.getLogger(__name__)
+
+# ==================== WRITE-BEHIND BUFFER ====================
+class ActivityBuffer:
+    """Collects user upserts and last_active touches in memory, one entry per
+    user, and writes them as unordered bulk writes in the background"""
+
+    def __init__(self, interval: float = ACTIVITY_FLUSH_INTERVAL):
+        self.interval = interval
+        self.pending: Dict[int, Dict] = {}
+        self.touches = 0
+        self.writes = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def touch(self, user, reachable: bool = False):
+        """Record that a user was active; repeated touches merge into one write.
+        `reachable` means the bot just reached the user in PM, so a blocked
+        flag from an earlier broadcast no longer holds."""
+        if user is None:
+            return
+        self.touches += 1
+        previous = self.pending.get(user.id)
+        self.pending[user.id] = {
+            "first_name": user.first_name,
+            "username": user.username,
+            "last_active": datetime.now(),
+            "reachable": reachable or bool(previous and previous["reachable"])
+        }
+
+    @staticmethod
+    def _update(entry: Dict) -> Dict:
+        update = {
+            "$set": {"first_name": entry["first_name"], "username": entry["username"]},
+            "$max": {"last_active": entry["last_active"]},
+            "$setOnInsert": {"banned": False, "joined_at": entry["last_active"]}
+        }
+        if entry["reachable"]:
+            update["$unset"] = {"blocked": "", "blocked_at": ""}
+        return update
+
+    def _restore(self, pending: Dict[int, Dict]):
+        """Put a batch that failed to write back, under any newer touches"""
+        for user_id, entry in pending.items():
+            newer = self.pending.get(user_id)
+            if newer is None:
+                self.pending[user_id] = entry
+            elif entry["reachable"]:
+                newer["reachable"] = True
+
+    async def flush(self):
+        async with self._lock:
+            pending, self.pending = self.pending, {}
+            if not pending:
+                return
+            try:
+                result = await users_col.bulk_write([
+                    UpdateOne({"user_id": user_id}, self._update(entry), upsert=True)
+                    for user_id, entry in pending.items()
+                ], ordered=False)
+            except Exception:
+                self._restore(pending)
+                raise
+            self.writes += len(pending)
+            await stats.incr("users", result.upserted_count)
+            user_ids = list(pending)
+            for index in result.upserted_ids:
+                user_id = user_ids[index]
+                entry = pending[user_id]
+                sink.emit("user", f"`{user_id}` {entry['first_name']} "
+                                  f"(@{entry['username'] or 'N/A'})")
+
+            # Only users not yet seen today match, so the modified count is
+            # exactly today's new daily-active users across all processes
+            today = stats.day_key(datetime.now())
+            daily = await users_col.bulk_write([
+                UpdateOne(
+                    {"user_id": user_id, "active_day": {"$ne": today}},
+                    {"$set": {"active_day": today}}
+                )
+                for user_id in pending
+            ], ordered=False)
+            await stats.record_active(today, daily.modified_count)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("User activity flush failed")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "pending": len(self.pending),
+            "touches": self.touches,
+            "writes": self.writes
+        }
+
+activity = ActivityBuffer()
@@ -1,40 +1,116 @@
-from flask import Flask
-import threading
 import asyncio
-import os
+import signal
 import sys
+from aiohttp import web
 
 sys.path.append('.')
-from bot import app as telegram_bot
-
-# Flask app
-web_app = Flask(__name__)
-
-@web_app.route('/')
-def home():
-    return "✅ Telegram Auto-Filter Bot is running!"
-
-def run_telegram_bot():
-    """Run Telegram bot with new event loop"""
-    # ✅ FIX: Create new event loop for thread
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(telegram_bot.start())
-    
-    # Keep bot running
+from bot import app as telegram_bot, startup, shutdown
+from config import PORT, HEALTH_MAX_LAG, DRAIN_TIMEOUT
+from cache import result_cache, search_flight
+from ratelimit import throttle, SEND, SEARCH, INLINE
+from clones import supervisor
+from activity import activity
+from catalog import catalog
+from scheduler import scheduler
+import database
+import delivery
+from logsink import sink
+import fsub
+import metrics
+import stats
+
+# ==================== METRICS ====================
+metrics.Gauge("bot_users", "Users known to the bot", lambda: stats.snapshot["users"])
+metrics.Gauge("bot_files", "Indexed files", lambda: stats.snapshot["files"])
+metrics.Gauge("search_cache_hits_local", "Result cache hits in process", lambda: result_cache.hits_local)
+metrics.Gauge("search_cache_hits_shared", "Result cache hits in cache_col", lambda: result_cache.hits_shared)
+metrics.Gauge("search_cache_misses", "Result cache misses", lambda: result_cache.misses)
+metrics.Gauge("searches_coalesced", "Searches served by an identical in-flight search", lambda: search_flight.coalesced)
+metrics.Gauge("searches_throttled", "Searches dropped by the user/chat limits", lambda: throttle.throttled[SEARCH])
+metrics.Gauge("inline_throttled", "Inline queries dropped by the inline limit", lambda: throttle.throttled[INLINE])
+metrics.Gauge("sends_throttled", "File deliveries dropped by the user limit", lambda: throttle.throttled[SEND])
+metrics.Gauge("throttle_waiting", "Deliveries queued for a user token", lambda: sum(throttle.waiting.values()))
+metrics.Gauge("fsub_api_calls", "get_chat_member calls made", lambda: fsub.api_calls)
+metrics.Gauge("fsub_calls_saved", "get_chat_member calls answered from cache", lambda: fsub.calls_saved)
+metrics.Gauge("user_activity_pending", "Users waiting for the next activity flush", lambda: len(activity.pending))
+metrics.Gauge("users_active_today", "Distinct users active today", lambda: stats.snapshot["active_today"])
+metrics.Gauge("catalog_files", "Files in the in-memory catalog", lambda: len(catalog))
+metrics.Gauge("catalog_memory_bytes", "Approximate in-memory catalog size", catalog.memory_bytes)
+metrics.Gauge("catalog_load_seconds", "Time the in-memory catalog took to load", lambda: catalog.load_seconds or 0)
+metrics.Gauge("deliveries_running", "Send-all deliveries in progress", lambda: delivery.stats()["jobs"])
+metrics.Gauge("deliveries_queued", "Files waiting in send-all deliveries", lambda: delivery.stats()["queued"])
+metrics.Gauge("log_events_pending", "Log channel events waiting for the next digest", lambda: len(sink.events))
+metrics.Gauge("log_events_dropped", "Log channel events dropped on a full buffer", lambda: sink.dropped)
+metrics.Gauge("scheduled_actions_pending", "Timed actions waiting to run", scheduler.pending)
+metrics.Gauge("clones_running", "Clone bots running in this process", lambda: len(supervisor.running))
+
+# ==================== HTTP ====================
+web_app = web.Application()
+draining = False
+
+async def home(request):
+    return web.Response(text="✅ Telegram Auto-Filter Bot is running!")
+
+async def healthz(request):
+    """Liveness: the event loop is answering without excessive lag"""
+    lag = metrics.loop_lag.value
+    healthy = lag < HEALTH_MAX_LAG
+    return web.json_response(
+        {"status": "ok" if healthy else "lagging", "loop_lag": round(lag, 4)},
+        status=200 if healthy else 503
+    )
+
+async def readyz(request):
+    """Readiness: MongoDB answers and Telegram is connected"""
     try:
-        loop.run_forever()
-    except KeyboardInterrupt:
-        pass
-    finally:
-        loop.run_until_complete(telegram_bot.stop())
-        loop.close()
+        mongo = await asyncio.wait_for(database.ping(), 2)
+    except asyncio.TimeoutError:
+        mongo = False
+    telegram = bool(telegram_bot.is_connected)
+    ready = mongo and telegram and not draining
+    return web.json_response(
+        {"mongo": mongo, "telegram": telegram, "draining": draining},
+        status=200 if ready else 503
+    )
+
+async def metrics_endpoint(request):
+    return web.Response(
+        body=metrics.render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+web_app.router.add_get("/", home)
+web_app.router.add_get("/healthz", healthz)
+web_app.router.add_get("/readyz", readyz)
+web_app.router.add_get("/metrics", metrics_endpoint)
+
+# ==================== RUNNER ====================
+async def main():
+    """Run the bot and the HTTP server on one event loop"""
+    global draining
+    await startup()
+    lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", PORT).start()
+    print(f"🌐 HTTP server on port {PORT}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    # Graceful shutdown: fail readiness, let running handlers finish, then stop
+    print("⏳ Shutting down...")
+    draining = True
+    if not await metrics.inflight.drain(DRAIN_TIMEOUT):
+        print(f"⚠️ {metrics.inflight.count} handlers still running after {DRAIN_TIMEOUT}s")
+    await shutdown()
+    lag_task.cancel()
+    await runner.cleanup()
 
 if __name__ == "__main__":
-    # Start bot in separate thread
-    bot_thread = threading.Thread(target=run_telegram_bot, daemon=True)
-    bot_thread.start()
-    
-    # Start Flask server
-    port = int(os.environ.get("PORT", 10000))
-    web_app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
+    # Pyrogram binds the client to its loop at import; run on that loop
+    telegram_bot.run(main())
@@ -0,0 +1,101 @@
+import random
+from typing import Iterator, List, Tuple
+
+# ==================== VOCABULARY ====================
+WORDS = [
+    "the", "dark", "last", "kingdom", "house", "dragon", "money", "heist", "stranger",
+    "things", "breaking", "bad", "crown", "wild", "city", "lost", "night", "sacred",
+    "games", "family", "man", "mirzapur", "panchayat", "kota", "factory", "office",
+    "sherlock", "peaky", "blinders", "witcher", "boys", "squid", "game", "dark", "mind",
+    "hunter", "narcos", "ozark", "vikings", "fargo", "lucifer", "dexter", "friends",
+    "silicon", "valley", "succession", "better", "call", "saul", "paatal", "lok",
+    "asur", "aspirants", "farzi", "scam", "delhi", "crime", "made", "heaven", "rana",
+    "naidu", "jawan", "pathaan", "animal", "leo", "jailer", "vikram", "kantara", "rrr",
+    "pushpa", "kgf", "chapter", "dune", "oppenheimer", "interstellar", "inception"
+]
+QUALITIES = ["480p", "720p", "1080p", "2160p", "4K"]
+SOURCES = ["WEB-DL", "WEBRip", "BluRay", "HDRip", "HDTV", "AMZN WEB-DL", "NF WEB-DL", "DVDRip"]
+CODECS = ["x264", "x265", "HEVC", "H.264", "AV1"]
+AUDIO = ["AAC", "DD5.1", "DDP5.1", "Atmos", "AC3"]
+LANGUAGES = ["Hindi", "English", "Tamil", "Telugu", "Dual Audio", "Multi", "Korean"]
+GROUPS = ["PSA", "YTS", "RARBG", "Pahe", "TamilMV", "HDHub4u", "Vegamovies", "MkvCinemas"]
+TAGS = ["@MoviesHub", "[TG@Series4U]", "@CinemaCorner", "www.1TamilMV.ws -"]
+EXTENSIONS = [".mkv", ".mp4", ".avi"]
+SEPARATORS = [".", " ", "_"]
+
+# ==================== CATALOG ====================
+def make_titles(count: int, rng: random.Random) -> List[Tuple[str, bool]]:
+    """Distinct titles, each flagged as a series or a movie"""
+    titles = set()
+    while len(titles) < count:
+        titles.add(" ".join(rng.sample(WORDS, rng.choice((1, 2, 2, 3, 3, 4)))).title())
+    return [(title, rng.random() < 0.4) for title in sorted(titles)]
+
+def make_filename(title: str, series: bool, rng: random.Random) -> str:
+    """A release filename with the season/quality markup and noise seen in channels"""
+    parts = []
+    if rng.random() < 0.15:
+        parts.append(rng.choice(TAGS))
+    parts.extend(title.split())
+    if series:
+        season = rng.randint(1, 8)
+        episode = rng.randint(1, 24)
+        parts.append(rng.choice((
+            f"S{season:02d}E{episode:02d}",
+            f"S{season}E{episode}",
+            f"Season {season} Episode {episode}",
+            f"S{season:02d} EP{episode:02d}"
+        )))
+    else:
+        parts.append(str(rng.randint(1960, 2024)))
+    if rng.random() < 0.9:
+        parts.append(rng.choice(QUALITIES))
+    parts.append(rng.choice(SOURCES))
+    if rng.random() < 0.6:
+        parts.append(rng.choice(LANGUAGES))
+    if rng.random() < 0.7:
+        parts.append(rng.choice(CODECS))
+    if rng.random() < 0.5:
+        parts.append(rng.choice(AUDIO))
+    name = rng.choice(SEPARATORS).join(parts)
+    if rng.random() < 0.6:
+        name += f"-{rng.choice(GROUPS)}"
+    return name + rng.choice(EXTENSIONS)
+
+def generate(count: int, seed: int = 1) -> Iterator[Tuple[int, str]]:
+    """(message_id, filename) pairs; the same seed gives the same catalog"""
+    rng = random.Random(seed)
+    titles = make_titles(max(count // 40, 50), rng)
+    for message_id in range(1, count + 1):
+        # Popular titles get many more uploads than the long tail
+        title, series = titles[min(int(rng.paretovariate(1.2)) - 1, len(titles) - 1)
+                               if rng.random() < 0.5 else rng.randrange(len(titles))]
+        yield message_id, make_filename(title, series, rng)
+
+# ==================== QUERY MIX ====================
+def make_typo(text: str, rng: random.Random) -> str:
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+def query_mix(count: int, seed: int = 1) -> List[str]:
+    """Queries shaped like real traffic: titles, title + season/quality, typos and misses"""
+    rng = random.Random(seed)
+    titles = [title.lower() for title, _ in make_titles(200, random.Random(seed))]
+    queries = []
+    for _ in range(count):
+        # A small head of titles accounts for most searches
+        title = titles[min(int(rng.paretovariate(1.1)) - 1, len(titles) - 1)]
+        roll = rng.random()
+        if roll < 0.45:
+            queries.append(title)
+        elif roll < 0.65:
+            queries.append(f"{title} s{rng.randint(1, 8):02d}")
+        elif roll < 0.8:
+            queries.append(f"{title} {rng.choice(QUALITIES).lower()}")
+        elif roll < 0.92:
+            queries.append(make_typo(title, rng))
+        else:
+            queries.append(" ".join(rng.sample(WORDS, 2)) + " zzz")
+    return queries
@@ -0,0 +1,47 @@
+import asyncio
+import shutil
+import socket
+import tempfile
+from typing import Optional
+
+class EphemeralMongod:
+    """A throwaway mongod on a free port with its data in a temp directory"""
+
+    def __init__(self, binary: str = "mongod"):
+        self.binary = shutil.which(binary) or binary
+        self.dbpath: Optional[str] = None
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.port = 0
+
+    @property
+    def url(self) -> str:
+        return f"mongodb://127.0.0.1:{self.port}"
+
+    async def start(self, timeout: float = 30):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.dbpath = tempfile.mkdtemp(prefix="bench_mongod_")
+        self.process = await asyncio.create_subprocess_exec(
+            self.binary, "--dbpath", self.dbpath, "--port", str(self.port),
+            "--bind_ip", "127.0.0.1", "--quiet",
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        deadline = asyncio.get_running_loop().time() + timeout
+        while asyncio.get_running_loop().time() < deadline:
+            if self.process.returncode is not None:
+                raise RuntimeError(f"mongod exited with code {self.process.returncode}")
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", self.port)
+                writer.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.2)
+        raise RuntimeError("mongod did not start in time")
+
+    async def stop(self):
+        if self.process and self.process.returncode is None:
+            self.process.terminate()
+            await self.process.wait()
+        if self.dbpath:
+            shutil.rmtree(self.dbpath, ignore_errors=True)
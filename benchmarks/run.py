@@ -0,0 +1,225 @@
+"""Offline benchmark for the search and render pipeline.
+
+Generates a synthetic catalog, loads it into MongoDB (an ephemeral mongod
+unless --mongo-url is given), replays a query mix through the bot's search
+and keyboard-building code against stubbed Pyrogram objects and writes the
+latency percentiles, throughput and memory to a JSON file.
+
+    python -m benchmarks.run --size 10k
+    python -m benchmarks.run --size 1m --queries queries.txt --output before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from benchmarks import catalog
+from benchmarks.mongod import EphemeralMongod
+from benchmarks.stubs import StubClient, StubMessage, channel_post
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = {"10k": 10_000, "1m": 1_000_000, "5m": 5_000_000}
+LOAD_BATCH = 10_000
+PARSE_SAMPLE = 20_000
+CHAT_ID = -1001000000000
+
+# ==================== MEASUREMENT ====================
+def summarize(latencies: List[float], wall: float) -> Dict:
+    """Percentiles in milliseconds and calls per second"""
+    ms = sorted(latency * 1000 for latency in latencies)
+    if len(ms) < 2:
+        ms = ms * 2 or [0.0, 0.0]
+    q = statistics.quantiles(ms, n=100, method="inclusive")
+    return {
+        "count": len(latencies),
+        "p50_ms": round(q[49], 3),
+        "p95_ms": round(q[94], 3),
+        "p99_ms": round(q[98], 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "max_ms": round(ms[-1], 3),
+        "throughput_per_s": round(len(latencies) / wall, 1) if wall else None
+    }
+
+async def replay(items: List, fn: Callable[..., Awaitable], concurrency: int) -> Dict:
+    """Run fn over every item with bounded concurrency and time each call"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item):
+        async with semaphore:
+            started = time.perf_counter()
+            await fn(item)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    return summarize(latencies, time.perf_counter() - started)
+
+def memory() -> Dict:
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"max_rss_mb": round(rss_kb / 1024, 1)}
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except Exception:
+        return None
+
+# ==================== CATALOG ====================
+async def load_catalog(files_col, size: int, seed: int) -> Dict:
+    """Fill the files collection through the indexer's own document builder"""
+    from indexer import build_file_doc
+
+    if await files_col.estimated_document_count() == size:
+        return {"reused": True}
+    await files_col.drop()
+    started = time.perf_counter()
+    batch = []
+    for message_id, file_name in catalog.generate(size, seed):
+        batch.append(build_file_doc(channel_post(CHAT_ID, message_id, file_name), CHAT_ID))
+        if len(batch) >= LOAD_BATCH:
+            await files_col.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await files_col.insert_many(batch, ordered=False)
+    wall = time.perf_counter() - started
+    return {"reused": False, "seconds": round(wall, 1), "docs_per_s": round(size / wall)}
+
+# ==================== STAGES ====================
+def bench_parse(size: int, seed: int) -> Dict:
+    """Filename parsing, the CPU cost of indexing one file"""
+    from metadata import file_fields
+
+    names = [name for _, name in catalog.generate(min(size, PARSE_SAMPLE), seed)]
+    latencies = []
+    started = time.perf_counter()
+    for name in names:
+        t = time.perf_counter()
+        file_fields(name)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started)
+
+async def bench(args, queries: List[str]) -> Dict:
+    import bot
+    import database
+    import dbmonitor
+    import fuzzy
+    import search
+    from config import SEARCH_LIMIT, SEARCH_MODE
+    from snapshots import create_snapshot
+
+    await database.ensure_indexes()
+    results = {"load": await load_catalog(database.files_col, args.size, args.seed)}
+    collstats = await database.db.command("collStats", "files")
+    results["collection"] = {
+        "docs": collstats["count"],
+        "data_mb": round(collstats["size"] / 2**20, 1),
+        "index_mb": round(collstats["totalIndexSize"] / 2**20, 1)
+    }
+    results["parse"] = bench_parse(args.size, args.seed)
+
+    async def search_uncached(query):
+        await search.search_files(database.files_col, query, SEARCH_LIMIT, SEARCH_MODE)
+    results["search"] = await replay(queries, search_uncached, args.concurrency)
+
+    # The handler path: result cache in front of the search
+    results["find_files"] = await replay(queries, bot.find_files, args.concurrency)
+
+    client = StubClient()
+    async def render(query):
+        found = await bot.find_files(query)
+        await bot.show_results(client, StubMessage(), query, found)
+    results["show_results"] = await replay(queries, render, args.concurrency)
+
+    async def page(query):
+        snapshot_id = await create_snapshot(query, await bot.find_files(query))
+        await bot.show_files_page(client, StubMessage(), snapshot_id, 0)
+    results["show_files_page"] = await replay(queries, page, args.concurrency)
+
+    await fuzzy.rebuild_titles()
+    async def suggest(query):
+        fuzzy.suggest(query)
+    results["fuzzy_suggest"] = await replay(queries, suggest, 1)
+
+    results["mongo"] = {
+        f"{dict(key)['collection']}.{dict(key)['command']}": {
+            "count": count, "mean_ms": round(total / count * 1000, 3)
+        }
+        for key, (_, total, count) in dbmonitor.command_latency.series.items()
+    }
+    return results
+
+# ==================== CLI ====================
+def parse_size(value: str) -> int:
+    return SIZES.get(value.lower()) or int(value)
+
+def read_queries(path: str) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+async def main(args) -> Dict:
+    mongod = None
+    url = args.mongo_url
+    if not url:
+        mongod = EphemeralMongod(args.mongod)
+        await mongod.start()
+        url = mongod.url
+    # config reads the environment at import, so set it before importing the bot
+    os.environ["MONGO_URL"] = url
+    os.environ["MONGO_DB"] = args.db
+    sys.path.insert(0, ROOT)
+
+    queries = read_queries(args.queries) if args.queries else catalog.query_mix(args.count, args.seed)
+    try:
+        stages = await bench(args, queries)
+    finally:
+        if "database" in sys.modules:
+            sys.modules["database"].close()
+        if mongod:
+            await mongod.stop()
+
+    return {
+        "run": {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "size": args.size,
+            "queries": len(queries),
+            "concurrency": args.concurrency,
+            "search_mode": os.getenv("SEARCH_MODE", "index"),
+            "python": platform.python_version()
+        },
+        "stages": stages,
+        "memory": memory()
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search and render pipeline benchmark")
+    parser.add_argument("--size", type=parse_size, default="10k", help="10k, 1m, 5m or a number")
+    parser.add_argument("--queries", help="file with one recorded query per line")
+    parser.add_argument("--count", type=int, default=2000, help="generated queries when --queries is not given")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of an ephemeral mongod")
+    parser.add_argument("--mongod", default="mongod", help="mongod binary for the ephemeral server")
+    parser.add_argument("--db", default="auto_filter_bench")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for name, stage in report["stages"].items():
+        if "p50_ms" in stage:
+            print(f"{name:16} p50 {stage['p50_ms']:>9} ms  p95 {stage['p95_ms']:>9} ms  "
+                  f"p99 {stage['p99_ms']:>9} ms  {stage['throughput_per_s']:>9}/s")
+    print(f"📄 Results written to {args.output}")
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+# ==================== PYROGRAM STUBS ====================
+# Just enough of Pyrogram's Message and Client for the render path; every
+# call is recorded instead of going to Telegram.
+
+class StubMessage:
+    def __init__(self, chat_id: int = 1, message_id: int = 1):
+        self.chat = SimpleNamespace(id=chat_id)
+        self.id = message_id
+        self.edits = 0
+        self.buttons = 0
+
+    async def edit(self, text, reply_markup=None, **kwargs):
+        self.edits += 1
+        if reply_markup is not None:
+            self.buttons += sum(len(row) for row in reply_markup.inline_keyboard)
+        return self
+
+    edit_text = edit
+
+    async def reply(self, text, **kwargs):
+        return StubMessage(self.chat.id, self.id + 1)
+
+    async def delete(self):
+        return True
+
+class StubClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        return StubMessage(chat_id)
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        self.calls += 1
+        return True
+
+def channel_post(chat_id: int, message_id: int, file_name: str) -> SimpleNamespace:
+    """A channel post carrying a document, as build_file_doc expects"""
+    return SimpleNamespace(
+        id=message_id,
+        caption=None,
+        video=None,
+        document=SimpleNamespace(
+            file_name=file_name,
+            file_id=f"BQAD{chat_id}_{message_id}",
+            file_unique_id=f"AgAD{chat_id}_{message_id}",
+            file_size=len(file_name) * 1000003 % 4000000000
+        )
+    )
@@ -1,42 +1,44 @@
 import os
-import re
+import time
 import asyncio
-import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Awaitable, List, Dict, Optional
 from pyrogram import Client, filters, idle
 from pyrogram.types import (
     Message, InlineKeyboardMarkup,
-    InlineKeyboardButton, CallbackQuery
+    InlineKeyboardButton, CallbackQuery, InlineQuery,
+    InlineQueryResultCachedDocument, InlineQueryResultCachedVideo
 )
-from pyrogram.errors import UserNotParticipant
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# ==================== CONFIG ====================
-API_ID = int(os.getenv("API_ID", 0))
-API_HASH = os.getenv("API_HASH", "")
-BOT_TOKEN = os.getenv("BOT_TOKEN", "")
-MONGO_URL = os.getenv("MONGO_URL", "")
-ADMIN_ID = int(os.getenv("ADMIN_ID", 0))
-LOG_CHANNEL = int(os.getenv("LOG_CHANNEL", 0))
-FSUB_CHANNELS = [int(x) for x in os.getenv("FSUB_CHANNELS", "").split() if x]
-
-# ==================== DATABASE ====================
-try:
-    mongo = MongoClient(MONGO_URL)
-    db = mongo["auto_filter_bot"]
-    users_col = db["users"]
-    files_col = db["files"]
-    clone_bots_col = db["clone_bots"]
-    cache_col = db["cache"]
-    print("✅ MongoDB Connected")
-except ConnectionFailure:
-    print("❌ MongoDB Connection Failed")
-    exit(1)
+from pyrogram.file_id import FileId, FileType
+from pyrogram.storage import MemoryStorage
+from config import (
+    API_ID, API_HASH, BOT_TOKEN, ADMIN_ID,
+    FSUB_CHANNELS, SEARCH_MODE, SEARCH_LIMIT, ITEMS_PER_PAGE,
+    FUZZY_MIN_HITS, FUZZY_MIN_SCORE, SOURCE_CHANNELS, SEND_ALL_LIMIT,
+    INLINE_PAGE_SIZE, INLINE_CACHE_TIME, INLINE_DEADLINE
+)
+from search import search_files, normalize, SEARCH_MODE_REGEX, SEARCH_MODE_MEMORY
+from catalog import catalog
+from metadata import backfill_metadata
+from dedup import compact_duplicates
+import indexer
+import broadcast
+import delivery
+import transfer
+import fsub
+import callback_state
+from scheduler import scheduler
+from activity import activity
+from logsink import sink
+import stats
+import fuzzy
+import dbmonitor
+from clones import supervisor
+from metrics import Counter, Histogram, instrument, set_branch
+from cache import result_cache, search_flight
+from ratelimit import throttle, SEND, SEARCH, INLINE
+from snapshots import create_snapshot, get_page, narrow_snapshot
+import database
+from database import files_col
 
 # ==================== BOT CLIENT ====================
 app = Client(
@@ -47,46 +49,45 @@ app = Client(
 )
 
 # ==================== UTILITY FUNCTIONS ====================
-def extract_season_quality(filename: str) -> Dict:
-    """Extract season and quality from filename"""
-    season_match = re.search(r's(\d{1,2})', filename.lower())
-    quality_match = re.search(r'(\d{3,4})p', filename.lower())
+async def find_files(query: str, season: Optional[str] = None,
+                     quality: Optional[str] = None) -> List[Dict]:
+    """Search files, serving repeated queries from the result cache"""
+    # The in-memory catalog answers faster than any cache lookup
+    if SEARCH_MODE == SEARCH_MODE_MEMORY and catalog.ready:
+        return catalog.search(query, SEARCH_LIMIT, season, quality)
+    
+    # The regex fallback matches substrings, which term invalidation can't track
+    use_cache = SEARCH_MODE != SEARCH_MODE_REGEX
+    key = result_cache.make_key(query, season, quality)
     
-    return {
-        "season": f"S{season_match.group(1).zfill(2)}" if season_match else None,
-        "quality": f"{quality_match.group(1)}p" if quality_match else None
-    }
+    async def lookup():
+        if use_cache:
+            results = await result_cache.get(key)
+            if results is not None:
+                return results
+        results = await search_files(files_col, query, SEARCH_LIMIT, SEARCH_MODE,
+                                     season=season, quality=quality)
+        if use_cache:
+            await result_cache.set(key, query, results)
+        return results
+    
+    # Identical queries arriving together share one lookup
+    return await search_flight.do(key, lookup)
 
 async def check_fsub(user_id: int) -> bool:
     """Check force subscribe"""
-    if not FSUB_CHANNELS:
-        return True
-    
-    for channel in FSUB_CHANNELS:
-        try:
-            member = await app.get_chat_member(channel, user_id)
-            if member.status in ["left", "kicked"]:
-                return False
-        except:
-            pass
-    return True
+    return await fsub.is_subscribed(app, user_id)
 
 # ==================== START COMMAND ====================
 @app.on_message(filters.command("start") & filters.private)
+@instrument("start_command")
 async def start_command(client: Client, message: Message):
     user = message.from_user
     
-    # Add user to DB
-    users_col.update_one(
-        {"user_id": user.id},
-        {"$set": {
-            "first_name": user.first_name,
-            "username": user.username,
-            "last_active": datetime.now(),
-            "banned": False
-        }},
-        upsert=True
-    )
+    # Upserted in the background with other users' activity; new users
+    # are reported to the log channel from there. A private /start means
+    # the bot can message the user again
+    activity.touch(user, reachable=True)
     
     # Welcome with photo
     welcome_text = f"""
@@ -133,23 +134,10 @@ All-in-one solution for movie searching!
         )
     except:
         await message.reply(welcome_text, reply_markup=buttons)
-    
-    # Log to channel
-    if LOG_CHANNEL:
-        try:
-            await client.send_message(
-                LOG_CHANNEL,
-                f"👤 **New User Started**\n\n"
-                f"🆔 ID: `{user.id}`\n"
-                f"👤 Name: {user.first_name}\n"
-                f"📛 Username: @{user.username or 'N/A'}\n"
-                f"📅 Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-            )
-        except:
-            pass
 
 # ==================== AUTO FILTER WITH BUTTONS ====================
 @app.on_message(filters.group & filters.text)
+@instrument("auto_filter")
 async def auto_filter(client: Client, message: Message):
     query = message.text.strip()
     if len(query) < 2:
@@ -157,6 +145,10 @@ async def auto_filter(client: Client, message: Message):
     
     user_id = message.from_user.id
     
+    # Over the user's or group's search rate: drop quietly rather than add noise
+    if not throttle.admit(SEARCH, user_id, message.chat.id):
+        return
+    
     # Force subscribe check
     if not await check_fsub(user_id):
         buttons = InlineKeyboardMarkup([[
@@ -167,40 +159,70 @@ async def auto_filter(client: Client, message: Message):
             "You need to subscribe to use this bot.",
             reply_markup=buttons
         )
-        await asyncio.sleep(10)
-        await msg.delete()
+        await scheduler.delete_later(client, msg.chat.id, [msg.id], 10)
         return
     
+    activity.touch(message.from_user)
+    
     # Show searching
     search_msg = await message.reply("🔍 **Searching...**")
     
-    # Search in DB with regex
-    results = list(files_col.find(
-        {"file_name": {"$regex": query, "$options": "i"}}
-    ).limit(100))
+    # Search the term index
+    results = await find_files(query)
+    stats.record_search(query, found=bool(results))
+    
+    # Too few hits: offer close titles from the trigram index
+    suggestion_buttons = []
+    if len(results) < FUZZY_MIN_HITS:
+        suggestions = [
+            title for title, score in fuzzy.suggest(query)
+            if score >= FUZZY_MIN_SCORE and title != normalize(query)
+        ]
+        callbacks = await callback_state.put_many([
+            {"action": "didyoumean", "query": title} for title in suggestions
+        ])
+        suggestion_buttons = [
+            [InlineKeyboardButton(f"🔎 Did you mean: {title}", callback_data=callback_data)]
+            for title, callback_data in zip(suggestions, callbacks)
+        ]
     
     if not results:
-        await search_msg.edit("❌ **No results found!**")
-        await asyncio.sleep(5)
-        await search_msg.delete()
+        if suggestion_buttons:
+            await search_msg.edit(
+                "❌ **No results found!**",
+                reply_markup=InlineKeyboardMarkup(suggestion_buttons)
+            )
+            await scheduler.delete_later(client, search_msg.chat.id, [search_msg.id], 60)
+        else:
+            await search_msg.edit("❌ **No results found!**")
+            await scheduler.delete_later(client, search_msg.chat.id, [search_msg.id], 5)
         return
     
+    await show_results(client, search_msg, query, results, suggestion_buttons)
+
+async def show_results(client, search_msg, query, results, extra_buttons=None):
+    """Snapshot a result set and show its season, quality or file picker"""
+    extra_buttons = extra_buttons or []
+    snapshot_id = await create_snapshot(query, results)
+    
     # Categorize by season
     seasons = {}
     for file in results:
-        metadata = extract_season_quality(file["file_name"])
-        if metadata["season"]:
-            if metadata["season"] not in seasons:
-                seasons[metadata["season"]] = []
-            seasons[metadata["season"]].append(file)
+        if file.get("season"):
+            if file["season"] not in seasons:
+                seasons[file["season"]] = []
+            seasons[file["season"]].append(file)
     
     # Create buttons based on results
     if len(seasons) > 1:
         # Multiple seasons - show season selection
+        shown = sorted(seasons.keys())[:8]  # Max 8 seasons
+        callbacks = await callback_state.put_many([
+            {"action": "season", "snapshot_id": snapshot_id, "season": season}
+            for season in shown
+        ])
         buttons = []
-        for season in sorted(seasons.keys())[:8]:  # Max 8 seasons
-            season_num = season.replace("S", "")
-            callback_data = f"season_{season_num}_{query}"
+        for season, callback_data in zip(shown, callbacks):
             buttons.append([
                 InlineKeyboardButton(
                     f"📂 {season} ({len(seasons[season])} files)",
@@ -211,7 +233,7 @@ async def auto_filter(client: Client, message: Message):
         await search_msg.edit(
             f"**🎬 Found {len(results)} results for '{query}'**\n\n"
             f"**Select Season:**",
-            reply_markup=InlineKeyboardMarkup(buttons)
+            reply_markup=InlineKeyboardMarkup(buttons + extra_buttons)
         )
     
     elif len(seasons) == 1:
@@ -222,14 +244,17 @@ async def auto_filter(client: Client, message: Message):
         # Extract qualities
         qualities = set()
         for file in files:
-            metadata = extract_season_quality(file["file_name"])
-            if metadata["quality"]:
-                qualities.add(metadata["quality"])
+            if file.get("quality"):
+                qualities.add(file["quality"])
         
+        shown = sorted(qualities)[:4]  # Max 4 qualities
+        callbacks = await callback_state.put_many([
+            {"action": "quality", "snapshot_id": snapshot_id, "season": season, "quality": quality}
+            for quality in shown
+        ])
         buttons = []
         row = []
-        for quality in sorted(qualities)[:4]:  # Max 4 qualities per row
-            callback_data = f"quality_{quality}_{season}_{query}"
+        for quality, callback_data in zip(shown, callbacks):
             row.append(InlineKeyboardButton(
                 f"🎚️ {quality}",
                 callback_data=callback_data
@@ -243,38 +268,54 @@ async def auto_filter(client: Client, message: Message):
         await search_msg.edit(
             f"**📂 {season}**\n"
             f"**Select Quality:**",
-            reply_markup=InlineKeyboardMarkup(buttons)
+            reply_markup=InlineKeyboardMarkup(buttons + extra_buttons)
         )
     
     else:
         # No season - show files directly
-        await show_files_page(client, search_msg, results, query, 0)
+        await show_files_page(client, search_msg, snapshot_id, 0, extra_buttons)
 
-async def show_files_page(client, message, files, query, page):
-    """Show files with pagination"""
-    items_per_page = 8
-    start = page * items_per_page
-    end = start + items_per_page
-    current_files = files[start:end]
+async def show_files_page(client, message, snapshot_id, page, extra_buttons=None) -> bool:
+    """Show one page of a result snapshot; False if the snapshot expired"""
+    snapshot, current_files = await get_page(snapshot_id, page, ITEMS_PER_PAGE)
+    if snapshot is None:
+        return False
     
-    total_pages = (len(files) + items_per_page - 1) // items_per_page
+    start = page * ITEMS_PER_PAGE
+    end = start + ITEMS_PER_PAGE
+    total = snapshot["total"]
+    total_pages = (total + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
     
-    text = f"**🔍 Results for: '{query}'**\n"
+    title = " - ".join(filter(None, [snapshot["query"], snapshot["season"], snapshot["quality"]]))
+    text = f"**🔍 Results for: '{title}'**\n"
     text += f"**📄 Page {page+1}/{total_pages}**\n\n"
     
+    # Register every button's state in one round trip
+    states = [
+        {"action": "send", "file": file["_id"], "chat_id": file["chat_id"],
+         "message_id": file["message_id"]}
+        for file in current_files
+    ]
+    if page > 0:
+        states.append({"action": "page", "snapshot_id": snapshot_id, "page": page - 1})
+    if end < total:
+        states.append({"action": "page", "snapshot_id": snapshot_id, "page": page + 1})
+    # Season and quality pages can be delivered in one go
+    send_all = bool(snapshot["season"] or snapshot["quality"]) and total > 1
+    if send_all:
+        states.append({"action": "sendall", "snapshot_id": snapshot_id})
+    callbacks = await callback_state.put_many(states)
+    
     buttons = []
     
-    for i, file in enumerate(current_files, start+1):
+    for i, (file, callback_data) in enumerate(zip(current_files, callbacks), start+1):
         # Truncate filename
         display_name = file["file_name"]
         if len(display_name) > 35:
             display_name = display_name[:32] + "..."
         
         # Add quality info
-        metadata = extract_season_quality(file["file_name"])
-        quality_text = f" [{metadata['quality']}]" if metadata["quality"] else ""
-        
-        callback_data = f"send_{file['file_id']}_{file['chat_id']}_{file['message_id']}"
+        quality_text = f" [{file['quality']}]" if file.get("quality") else ""
         
         buttons.append([
             InlineKeyboardButton(
@@ -284,29 +325,135 @@ async def show_files_page(client, message, files, query, page):
         ])
     
     # Pagination buttons
+    nav_callbacks = iter(callbacks[len(current_files):])
     nav_buttons = []
     if page > 0:
         nav_buttons.append(
-            InlineKeyboardButton("⬅️ Previous", callback_data=f"page_{page-1}_{query}")
+            InlineKeyboardButton("⬅️ Previous", callback_data=next(nav_callbacks))
         )
-    if end < len(files):
+    if end < total:
         nav_buttons.append(
-            InlineKeyboardButton("Next ➡️", callback_data=f"page_{page+1}_{query}")
+            InlineKeyboardButton("Next ➡️", callback_data=next(nav_callbacks))
         )
     
     if nav_buttons:
         buttons.append(nav_buttons)
+    if send_all:
+        buttons.append([InlineKeyboardButton(
+            f"📦 Send all ({min(total, SEND_ALL_LIMIT)})", callback_data=next(nav_callbacks)
+        )])
+    buttons.extend(extra_buttons or [])
     
     await message.edit(text, reply_markup=InlineKeyboardMarkup(buttons))
+    return True
+
+async def show_drilldown(client, callback, snapshot_id, season, quality=None):
+    """Narrow a snapshot to a season/quality and show its first page"""
+    parent, child_id = await narrow_snapshot(snapshot_id, season, quality)
+    if parent is None:
+        await callback.answer("⌛ Search expired, please search again!", show_alert=True)
+        return
+    if child_id is None:
+        await callback.answer("No files found!", show_alert=True)
+        return
+    
+    await show_files_page(client, callback.message, child_id, 0)
+
+# ==================== INLINE SEARCH ====================
+inline_latency = Histogram(
+    "inline_answer_seconds", "Inline query time to answer",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15)
+)
+inline_late = Counter("inline_late_total", "Inline answers slower than the inline deadline")
+
+def inline_result(file: Dict, result_id: str):
+    """Cached result for a file; videos must be sent as videos"""
+    details = " • ".join(filter(None, [
+        file.get("season"),
+        f"E{file['episode']:02d}" if file.get("episode") is not None else None,
+        file.get("quality")
+    ]))
+    try:
+        is_video = FileId.decode(file["file_id"]).file_type == FileType.VIDEO
+    except Exception:
+        is_video = False
+    if is_video:
+        return InlineQueryResultCachedVideo(
+            video_file_id=file["file_id"], id=result_id,
+            title=file["file_name"], description=details, caption=file["file_name"]
+        )
+    return InlineQueryResultCachedDocument(
+        document_file_id=file["file_id"], id=result_id,
+        title=file["file_name"], description=details, caption=file["file_name"]
+    )
+
+@app.on_inline_query()
+@instrument("inline_search")
+async def inline_search(client: Client, inline_query: InlineQuery):
+    """Search from any chat; scrolling pages slice the cached result list"""
+    started = time.monotonic()
+    query = inline_query.query.strip()
+    user_id = inline_query.from_user.id
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    
+    if len(query) < 2:
+        await inline_query.answer([], cache_time=INLINE_CACHE_TIME,
+                                  switch_pm_text="🔍 Type a movie or series name",
+                                  switch_pm_parameter="start")
+        return
+    
+    # Only new searches count against the rate limit; scrolling is a cache slice.
+    # Over it, answer empty so the client isn't left waiting on the query
+    if offset == 0 and not throttle.admit(INLINE, user_id):
+        await inline_query.answer([], cache_time=0, is_personal=True)
+        return
+    
+    if not await check_fsub(user_id):
+        await inline_query.answer([], cache_time=0, is_personal=True,
+                                  switch_pm_text="⚠️ Join our channel to search",
+                                  switch_pm_parameter="start")
+        return
+    
+    activity.touch(inline_query.from_user)
+    results = await find_files(query)
+    if offset == 0:
+        stats.record_search(query, found=bool(results))
+    
+    page = results[offset:offset + INLINE_PAGE_SIZE]
+    next_offset = offset + INLINE_PAGE_SIZE
+    await inline_query.answer(
+        [inline_result(file, str(i)) for i, file in enumerate(page, offset)],
+        cache_time=INLINE_CACHE_TIME,
+        # Telegram shares cached answers between users; keep them per user
+        # when membership decides who may see results
+        is_personal=bool(FSUB_CHANNELS),
+        next_offset=str(next_offset) if next_offset < len(results) else ""
+    )
+    
+    elapsed = time.monotonic() - started
+    inline_latency.observe(elapsed, page="first" if offset == 0 else "next")
+    if elapsed > INLINE_DEADLINE:
+        inline_late.inc()
 
 # ==================== CALLBACK HANDLER ====================
-@app.on_callback_query()
-async def callback_handler(client: Client, callback: CallbackQuery):
-    data = callback.data
+# Actions with their own latency series; anything else is labelled "unknown"
+CALLBACK_BRANCHES = {
+    "send", "sendall", "season", "quality", "didyoumean", "page",
+    "clone_info", "admin_panel", "stats", "back_to_start"
+}
+SEARCH_ACTIONS = {"season", "quality", "didyoumean"}
+
+async def ignore_answer(*args, **kwargs):
+    """Stands in for callback.answer once the query has been answered"""
+
+async def deliver(client, callback, data, state, answer):
+    """Send one file or queue a season/quality set to the user's PM.
+    The main bot delivers for clones too: only it can read the source channels."""
     user_id = callback.from_user.id
+    unreachable = f"⚠️ I can't message you yet! Start @{app.me.username} in PM, then tap again."
     
     # Force subscribe check for file sending
-    if data.startswith("send_") and not await check_fsub(user_id):
+    if not await check_fsub(user_id):
         buttons = InlineKeyboardMarkup([[
             InlineKeyboardButton("📢 Join Channel", url=f"https://t.me/{FSUB_CHANNELS[0]}")
         ]])
@@ -315,71 +462,107 @@ async def callback_handler(client: Client, callback: CallbackQuery):
             "You need to subscribe to download files.",
             reply_markup=buttons
         )
-        await callback.answer()
+        await answer()
         return
     
-    if data.startswith("send_"):
+    if data == "send":
         # Send file to PM
-        _, file_id, chat_id, message_id = data.split("_")
-        
         try:
-            await client.copy_message(
-                chat_id=user_id,
-                from_chat_id=int(chat_id),
-                message_id=int(message_id)
-            )
-            await callback.answer("✅ File sent to your PM!", show_alert=True)
-        except Exception as e:
-            await callback.answer("❌ Failed to send file!", show_alert=True)
+            sent = await delivery.deliver_file(app, user_id, state)
+        except delivery.UNREACHABLE:
+            await answer(unreachable, show_alert=True)
+            return
+        except Exception:
+            sent = False
+        if sent:
+            activity.touch(callback.from_user, reachable=True)
+            await answer("✅ File sent to your PM!", show_alert=True)
+        else:
+            await answer("❌ Failed to send file!", show_alert=True)
         
         # Delete group message after 15s
-        await asyncio.sleep(15)
-        await callback.message.delete()
+        await scheduler.delete_later(
+            client, callback.message.chat.id, [callback.message.id], 15
+        )
+        return
     
-    elif data.startswith("season_"):
-        # Season selected
-        _, season_num, query = data.split("_", 2)
-        season = f"S{season_num.zfill(2)}"
-        
-        # Search files for this season
-        results = list(files_col.find({
-            "file_name": {"$regex": query, "$options": "i"},
-            "file_name": {"$regex": f"season {season_num}|s{season_num}", "$options": "i"}
-        }))
-        
-        if results:
-            await show_files_page(client, callback.message, results, f"{query} - {season}", 0)
+    # Queue the whole season/quality set for delivery to PM
+    snapshot, files = await get_page(state["snapshot_id"], 0, SEND_ALL_LIMIT)
+    if snapshot is None:
+        await answer("⌛ Search expired, please search again!", show_alert=True)
+        return
+    files.sort(key=lambda f: (f.get("season") or "", f.get("episode") or 0, f["file_name"]))
+    try:
+        queued = await delivery.send_all(app, user_id, files)
+    except delivery.UNREACHABLE:
+        await answer(unreachable, show_alert=True)
+        return
+    if queued:
+        # The send-all status message already reached the user's PM
+        activity.touch(callback.from_user, reachable=True)
+        await answer(f"📤 Sending {queued} files to your PM!", show_alert=True)
+    else:
+        await answer("✅ You already received these files!", show_alert=True)
+
+@app.on_callback_query()
+@instrument("callback_handler")
+async def callback_handler(client: Client, callback: CallbackQuery):
+    data = callback.data
+    user_id = callback.from_user.id
+    
+    # Result buttons carry a short key; one lookup restores their state
+    state = {}
+    if data.startswith(callback_state.PREFIX):
+        state = await callback_state.resolve(data)
+        if state is None:
+            await callback.answer("⌛ This button has expired, please search again!", show_alert=True)
+            return
+        data = state["action"]
+    set_branch(data if data in CALLBACK_BRANCHES else "unknown")
+    
+    # File delivery is favored over actions that run a new search; neither
+    # waits for a token here, so a busy user can't hold a dispatcher worker
+    if data in ("send", "sendall"):
+        if throttle.admit(SEND, user_id):
+            await deliver(client, callback, data, state, callback.answer)
+        elif throttle.defer(user_id, lambda: deliver(client, callback, data, state, ignore_answer)):
+            await callback.answer("⏳ Queued, your files will arrive shortly!", show_alert=True)
         else:
-            await callback.answer("No files found!", show_alert=True)
+            await callback.answer("⏳ Too many requests, please slow down!", show_alert=True)
+        return
+    if data in SEARCH_ACTIONS and not throttle.admit(SEARCH, user_id, callback.message.chat.id):
+        await callback.answer("⏳ Too many requests, please slow down!", show_alert=True)
+        return
+    
+    if data == "season":
+        # Season selected
+        await show_drilldown(client, callback, state["snapshot_id"], state["season"])
     
-    elif data.startswith("quality_"):
+    elif data == "quality":
         # Quality selected
-        _, quality, season, query = data.split("_", 3)
-        
-        # Search files with this quality
-        results = list(files_col.find({
-            "file_name": {"$regex": query, "$options": "i"},
-            "file_name": {"$regex": quality, "$options": "i"}
-        }))
-        
-        if results:
-            await show_files_page(client, callback.message, results, f"{query} - {quality}", 0)
-        else:
-            await callback.answer("No files found!", show_alert=True)
+        await show_drilldown(client, callback, state["snapshot_id"], state["season"], state["quality"])
     
-    elif data.startswith("page_"):
-        # Pagination
-        _, page_str, query = data.split("_", 2)
-        page = int(page_str)
-        
-        results = list(files_col.find(
-            {"file_name": {"$regex": query, "$options": "i"}}
-        ))
-        
+    elif data == "didyoumean":
+        # Search the suggested title in a fresh reply to the original query
+        query = state["query"]
+        await callback.message.delete()
+        search_msg = await client.send_message(
+            callback.message.chat.id,
+            "🔍 **Searching...**",
+            reply_to_message_id=callback.message.reply_to_message_id
+        )
+        results = await find_files(query)
+        stats.record_search(query, found=bool(results))
         if results:
-            await show_files_page(client, callback.message, results, query, page)
+            await show_results(client, search_msg, query, results)
         else:
-            await callback.answer("No results!", show_alert=True)
+            await search_msg.edit("❌ **No results found!**")
+            await scheduler.delete_later(client, search_msg.chat.id, [search_msg.id], 5)
+    
+    elif data == "page":
+        # Pagination reads the page slice straight from the snapshot
+        if not await show_files_page(client, callback.message, state["snapshot_id"], state["page"]):
+            await callback.answer("⌛ Search expired, please search again!", show_alert=True)
     
     elif data == "clone_info":
         # Clone bot info
@@ -403,16 +586,39 @@ async def callback_handler(client: Client, callback: CallbackQuery):
     
     elif data == "admin_panel":
         if user_id == ADMIN_ID:
-            total_users = users_col.count_documents({})
-            total_files = files_col.count_documents({})
+            cache_stats = result_cache.stats()
+            throttle_stats = throttle.stats()
+            catalog_text = ""
+            if catalog.ready:
+                catalog_stats = catalog.stats()
+                catalog_text = (
+                    f"🧠 Catalog: {catalog_stats['files']} files, {catalog_stats['memory_mb']} MB, "
+                    f"loaded in {catalog_stats['load_seconds']}s from {catalog_stats['source']}\n"
+                )
+            channels = "".join(
+                f"  • `{row['_id']}`: {row['files']}\n"
+                for row in stats.snapshot["files_per_channel"][:5]
+            )
             
             await callback.message.edit(
                 f"**👑 Admin Panel**\n\n"
-                f"👥 Users: {total_users}\n"
-                f"📁 Files: {total_files}\n"
+                f"👥 Users: {stats.snapshot['users']}\n"
+                f"📁 Files: {stats.snapshot['files']}\n"
+                f"{channels}"
+                f"🗃️ Cache: {cache_stats['hits_local'] + cache_stats['hits_shared']} hits / "
+                f"{cache_stats['misses']} misses ({cache_stats['size']} entries)\n"
+                f"{catalog_text}"
+                f"🔗 Coalesced searches: {search_flight.coalesced}\n"
+                f"⏳ Throttled: {throttle_stats['throttled_searches']} searches, "
+                f"{throttle_stats['throttled_inline']} inline, "
+                f"{throttle_stats['throttled_sends']} sends\n"
                 f"🤖 Bot: @{client.me.username}\n\n"
                 f"**Commands:**\n"
                 f"/index - Index channel\n"
+                f"/backfill - Rebuild search fields\n"
+                f"/dedup - Merge duplicate files\n"
+                f"/export - Export the catalog\n"
+                f"/import - Import a catalog export\n"
                 f"/stats - Statistics\n"
                 f"/broadcast - Send message\n"
                 f"/logs - View logs",
@@ -430,13 +636,19 @@ async def callback_handler(client: Client, callback: CallbackQuery):
             await callback.answer("❌ Admin only!", show_alert=True)
     
     elif data == "stats":
-        total_users = users_col.count_documents({})
-        total_files = files_col.count_documents({})
+        fsub_stats = fsub.stats()
+        searches_today = sum(count for _, count in stats.snapshot["searches_per_hour"])
+        top_queries = ", ".join(query for query, _ in stats.snapshot["top_queries"][:5])
         
         await callback.message.edit(
             f"**📊 Bot Statistics**\n\n"
-            f"👥 Total Users: {total_users}\n"
-            f"📁 Total Files: {total_files}\n"
+            f"👥 Total Users: {stats.snapshot['users']}\n"
+            f"📁 Total Files: {stats.snapshot['files']}\n"
+            f"🔎 Searches (24h): {searches_today}\n"
+            f"🟢 Active today: {stats.snapshot['active_today']}\n"
+            f"🔥 Top: {top_queries or 'N/A'}\n"
+            f"🎯 Fsub API calls saved: {fsub_stats['calls_saved']} "
+            f"(made {fsub_stats['api_calls']})\n"
             f"🔄 MongoDB: Connected\n"
             f"⚡ Status: Running\n"
             f"🤖 Username: @{client.me.username}",
@@ -466,24 +678,45 @@ async def callback_handler(client: Client, callback: CallbackQuery):
     
     await callback.answer()
 
+# ==================== FSUB MEMBERSHIP UPDATES ====================
+@app.on_chat_member_updated(filters.chat(FSUB_CHANNELS))
+@instrument("fsub_member_updated")
+async def fsub_member_updated(client: Client, update):
+    """Keep the membership cache current as users join or leave"""
+    fsub.on_member_update(update)
+
+# ==================== LIVE INDEXING ====================
+@app.on_message(filters.chat(SOURCE_CHANNELS) & (filters.document | filters.video))
+@instrument("live_index")
+async def live_index(client: Client, message: Message):
+    """Make new uploads in source channels searchable without an /index run"""
+    await indexer.live.add(message, message.chat.id)
+
+@app.on_edited_message(filters.chat(SOURCE_CHANNELS) & (filters.document | filters.video))
+@instrument("live_index_edit")
+async def live_index_edit(client: Client, message: Message):
+    await indexer.live.add(message, message.chat.id, edited=True)
+
+@app.on_deleted_messages(filters.chat(SOURCE_CHANNELS))
+@instrument("live_index_delete")
+async def live_index_delete(client: Client, messages: List[Message]):
+    by_chat = {}
+    for message in messages:
+        if message.chat:
+            by_chat.setdefault(message.chat.id, []).append(message.id)
+    for chat_id, message_ids in by_chat.items():
+        await indexer.live.remove(chat_id, message_ids)
+
 # ==================== CLONE BOT TOKEN HANDLER ====================
 @app.on_message(filters.private & filters.regex(r'^\d+:[\w-]+$'))
+@instrument("handle_token")
 async def handle_token(client: Client, message: Message):
     """Handle clone bot token"""
     token = message.text.strip()
     user_id = message.from_user.id
     
     # Save to database
-    clone_bots_col.update_one(
-        {"user_id": user_id},
-        {"$set": {
-            "token": token,
-            "created_at": datetime.now(),
-            "owner": message.from_user.first_name,
-            "active": True
-        }},
-        upsert=True
-    )
+    await database.save_clone_bot(user_id, token, message.from_user.first_name)
     
     await message.reply(
         "✅ **Clone bot created successfully!**\n\n"
@@ -491,98 +724,312 @@ async def handle_token(client: Client, message: Message):
         "• Use the same database\n"
         "• Have all features\n"
         "• Work 24/7\n\n"
-        "Start your bot by visiting:\n"
-        f"https://t.me/BotFather\n\n"
+        "It will come online within a minute.\n\n"
         "**Token saved securely!**"
     )
     
     # Log to channel
-    if LOG_CHANNEL:
-        try:
-            await client.send_message(
-                LOG_CHANNEL,
-                f"🌀 **New Clone Bot Created**\n\n"
-                f"👤 Owner: {message.from_user.mention}\n"
-                f"🆔 ID: `{user_id}`\n"
-                f"🤖 Token: `{token[:15]}...`\n"
-                f"📅 Time: {datetime.now().strftime('%H:%M:%S')}"
-            )
-        except:
-            pass
+    sink.emit("clone", f"{message.from_user.mention} (`{user_id}`) 🤖 `{token[:15]}...`")
 
 # ==================== ADMIN COMMANDS ====================
+index_tasks = set()
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+def index_progress_text(progress: Dict, done: bool = False) -> str:
+    header = "✅ **Indexing complete!**" if done else "⏳ **Indexing...**"
+    return (
+        f"{header}\n\n"
+        f"📢 Channel: `{progress['channel_id']}`\n"
+        f"📨 Scanned: {progress['scanned']} "
+        f"(msg {progress['last_message_id']}/{progress['top_message_id']})\n"
+        f"📁 Files: {progress['files']}\n"
+        f"⚡ Speed: {progress['rate']:.0f} msg/s\n"
+        f"⏱️ ETA: {format_duration(progress['eta'])}"
+    )
+
+async def run_index(client: Client, status: Message, channel_id: int, top_id: Optional[int]):
+    """Index one channel in the background, reporting on the status message"""
+    async def on_progress(progress):
+        await status.edit(index_progress_text(progress))
+    
+    try:
+        progress = await indexer.index_channel(client, channel_id, top_id, on_progress)
+        await status.edit(index_progress_text(progress, done=True))
+    except Exception as e:
+        await status.edit(f"❌ Error indexing `{channel_id}`: {str(e)}\n\nRun /index again to resume.")
+
 @app.on_message(filters.command("index") & filters.user(ADMIN_ID))
+@instrument("index_channel")
 async def index_channel(client: Client, message: Message):
-    if len(message.command) < 2:
-        await message.reply("Usage: `/index channel_id`", quote=True)
-        return
+    """Index channels from their checkpoints; add `full` to start over.
     
+    The last message id tells the indexer where to stop. Give it as
+    `channel_id:last_id`, or reply `/index` to a forwarded last post.
+    Later runs reuse the newest post seen so far."""
+    args = message.command[1:]
+    full = "full" in args
+    targets = []
+    forwarded = message.reply_to_message
+    if forwarded and forwarded.forward_from_chat:
+        targets.append((forwarded.forward_from_chat.id, forwarded.forward_from_message_id))
     try:
-        channel_id = int(message.command[1])
-        status = await message.reply("⏳ **Indexing started...**")
-        
-        count = 0
-        async for msg in client.iter_history(channel_id):
-            if msg.video or msg.document:
-                file_name = msg.video.file_name if msg.video else msg.document.file_name
-                file_id = msg.video.file_id if msg.video else msg.document.file_id
-                
-                files_col.update_one(
-                    {"file_id": file_id},
-                    {"$set": {
-                        "file_id": file_id,
-                        "file_name": file_name.lower(),
-                        "chat_id": channel_id,
-                        "message_id": msg.id,
-                        "caption": msg.caption or "",
-                        "indexed_at": datetime.now()
-                    }},
-                    upsert=True
-                )
-                count += 1
-        
-        await status.edit(f"✅ **Indexed {count} files!**")
+        for arg in args:
+            if arg != "full":
+                channel_id, _, top_id = arg.partition(":")
+                targets.append((int(channel_id), int(top_id) if top_id else None))
+    except ValueError:
+        await message.reply("❌ Channel and message ids must be numbers!", quote=True)
+        return
+    if not targets:
+        await message.reply(
+            "Usage: `/index channel_id[:last_message_id] [...] [full]`\n"
+            "Or reply `/index` to the channel's last post forwarded here.",
+            quote=True
+        )
+        return
+    
+    for channel_id, top_id in targets:
+        if indexer.is_running(channel_id):
+            await message.reply(f"⚠️ `{channel_id}` is already being indexed.")
+            continue
+        if full:
+            await indexer.reset_checkpoint(channel_id)
         
+        status = await message.reply(f"⏳ **Indexing `{channel_id}` queued...**")
+        task = asyncio.create_task(run_index(client, status, channel_id, top_id))
+        index_tasks.add(task)
+        task.add_done_callback(index_tasks.discard)
+
+maintenance_tasks: Dict[str, asyncio.Task] = {}
+
+def start_maintenance(name: str, job: Awaitable) -> bool:
+    """Run a collection-wide admin job in the background; False if one of
+    the same name is still running"""
+    running = maintenance_tasks.get(name)
+    if running and not running.done():
+        job.close()
+        return False
+    maintenance_tasks[name] = asyncio.create_task(job)
+    return True
+
+async def run_backfill(status: Message):
+    """Backfill in the background, reporting on the status message"""
+    try:
+        updated = await backfill_metadata(files_col)
+        titles = await fuzzy.rebuild_titles()
+        await status.edit(f"✅ **Backfilled {updated} files!**\n🔤 Titles indexed: {titles}")
     except Exception as e:
-        await message.reply(f"❌ Error: {str(e)}")
+        await status.edit(f"❌ Backfill failed: {str(e)}\n\nRun /backfill again to continue.")
+
+@app.on_message(filters.command("backfill") & filters.user(ADMIN_ID))
+@instrument("backfill_command")
+async def backfill_command(client: Client, message: Message):
+    """Add search terms and metadata to files indexed before they existed"""
+    status = await message.reply("⏳ **Backfilling search fields...**")
+    if not start_maintenance("backfill", run_backfill(status)):
+        await status.edit("⚠️ A backfill is already running.")
+
+async def run_dedup(status: Message):
+    """Merge duplicates in the background, reporting on the status message"""
+    try:
+        report = await compact_duplicates()
+        await status.edit(
+            f"✅ **Merged {report['groups']} duplicate groups!**\n"
+            f"🗑️ Documents removed: {report['removed']}"
+        )
+    except Exception as e:
+        await status.edit(f"❌ Dedup failed: {str(e)}\n\nRun /dedup again to continue.")
+
+@app.on_message(filters.command("dedup") & filters.user(ADMIN_ID))
+@instrument("dedup_command")
+async def dedup_command(client: Client, message: Message):
+    """Merge files indexed more than once into one document per file"""
+    status = await message.reply("⏳ **Merging duplicate files...**")
+    if not start_maintenance("dedup", run_dedup(status)):
+        await status.edit("⚠️ A dedup is already running.")
+
+transfer_tasks = set()
+
+async def run_transfer(status: Message, job: Awaitable, title: str):
+    """Run an export or import in the background, reporting on its status message"""
+    try:
+        result = await job
+        lines = "\n".join(f"• {key.replace('_', ' ').capitalize()}: `{value}`"
+                          for key, value in result.items())
+        await status.edit(f"✅ **{title} complete!**\n\n{lines}")
+    except Exception as e:
+        await status.edit(f"❌ {title} failed: {str(e)}\n\nRun it again to resume.")
+
+def start_transfer(status: Message, job: Awaitable, title: str):
+    task = asyncio.create_task(run_transfer(status, job, title))
+    transfer_tasks.add(task)
+    task.add_done_callback(transfer_tasks.discard)
+
+def transfer_progress(status: Message, title: str):
+    async def on_progress(collection: str, docs: int):
+        try:
+            await status.edit(f"⏳ **{title}...**\n\n📁 {collection.capitalize()}: {docs}")
+        except Exception:
+            pass
+    return on_progress
+
+@app.on_message(filters.command("export") & filters.user(ADMIN_ID))
+@instrument("export_command")
+async def export_command(client: Client, message: Message):
+    """Export the files catalog to compressed chunks; add `users` to include users"""
+    args = message.command[1:]
+    fmt = transfer.FORMAT_MSGPACK if "msgpack" in args else transfer.FORMAT_JSONL
+    try:
+        transfer.check_format(fmt)
+    except RuntimeError as e:
+        await message.reply(f"❌ {str(e)}", quote=True)
+        return
+    status = await message.reply("⏳ **Exporting catalog...**")
+    job = transfer.export_catalog(users="users" in args, fmt=fmt,
+                                  on_progress=transfer_progress(status, "Exporting catalog"))
+    start_transfer(status, job, "Export")
+
+@app.on_message(filters.command("import") & filters.user(ADMIN_ID))
+@instrument("import_command")
+async def import_command(client: Client, message: Message):
+    """Load an export directory; chunks already imported are skipped"""
+    if len(message.command) < 2:
+        await message.reply("Usage: `/import export_dir`", quote=True)
+        return
+    in_dir = message.command[1]
+    if not os.path.isfile(os.path.join(in_dir, "manifest.json")):
+        await message.reply(f"❌ No export found in `{in_dir}`!", quote=True)
+        return
+    status = await message.reply("⏳ **Importing catalog...**")
+    job = transfer.import_catalog(in_dir, transfer_progress(status, "Importing catalog"))
+    start_transfer(status, job, "Import")
+
+broadcast_tasks = set()
+
+def broadcast_progress_text(job: Dict, done: bool = False) -> str:
+    header = "✅ **Broadcast Complete!**" if done else "📢 **Broadcasting...**"
+    processed = job["success"] + job["failed"] + job["blocked"]
+    return (
+        f"{header}\n\n"
+        f"👥 Progress: {processed}/{job['total']}\n"
+        f"✅ Success: {job['success']}\n"
+        f"❌ Failed: {job['failed']}\n"
+        f"🚫 Blocked: {job['blocked']}\n"
+        f"⚡ Speed: {job.get('rate', 0):.1f} msg/s"
+    )
+
+async def run_broadcast(client: Client, job_id):
+    """Run a broadcast job in the background, reporting on its status message"""
+    async def on_progress(job):
+        await client.edit_message_text(
+            job["status_chat_id"], job["status_message_id"], broadcast_progress_text(job)
+        )
+    
+    job = await broadcast.run_job(client, job_id, on_progress)
+    try:
+        await client.edit_message_text(
+            job["status_chat_id"], job["status_message_id"],
+            broadcast_progress_text(job, done=True)
+        )
+    except Exception:
+        pass
+
+def start_broadcast(client: Client, job_id):
+    task = asyncio.create_task(run_broadcast(client, job_id))
+    broadcast_tasks.add(task)
+    task.add_done_callback(broadcast_tasks.discard)
 
 @app.on_message(filters.command("broadcast") & filters.user(ADMIN_ID))
+@instrument("broadcast_message")
 async def broadcast_message(client: Client, message: Message):
     if not message.reply_to_message:
         await message.reply("Reply to a message to broadcast!", quote=True)
         return
     
-    users = users_col.find({})
-    total = users_col.count_documents({})
-    
-    status = await message.reply(f"📢 Broadcasting to {total} users...")
+    status = await message.reply("📢 **Preparing broadcast...**")
+    job_id = await broadcast.create_job(
+        message.chat.id, message.reply_to_message.id, status.chat.id, status.id
+    )
+    start_broadcast(client, job_id)
+
+# ==================== BOT RUNNER ====================
+# Handlers clones don't get: inline results carry the main bot's file_ids,
+# clones aren't members of the source channels, and admin commands act on
+# the shared database
+MAIN_BOT_ONLY = {
+    inline_search, live_index, live_index_edit, live_index_delete,
+    index_channel, backfill_command, dedup_command,
+    export_command, import_command, broadcast_message
+}
+
+async def startup(shard: int = 0):
+    """Connect to MongoDB and start the bot; shard > 0 runs a clone worker"""
+    if not await database.ping():
+        print("❌ MongoDB Connection Failed")
+        exit(1)
+    if shard == 0:
+        await database.ensure_indexes()
+    print("✅ MongoDB Connected")
     
-    success = 0
-    failed = 0
+    # Workers only use the main bot for API calls such as fsub checks
+    app.no_updates = shard > 0
+    if shard > 0:
+        # Keep off the main process's session file; concurrent SQLite
+        # writers fail with "database is locked"
+        app.in_memory = True
+        app.storage = MemoryStorage(app.name)
+    await app.start()
+    await scheduler.start()
+    if shard == 0:
+        await scheduler.register_client(app)
+    await stats.start(leader=shard == 0)
+    await fuzzy.start()
+    # Workers search Mongo; a catalog per process would multiply its memory
+    if SEARCH_MODE == SEARCH_MODE_MEMORY and shard == 0:
+        await catalog.start()
+    sink.start(app)
+    dbmonitor.start(database.db)
+    indexer.live.start()
+    activity.start()
     
-    for user in users:
-        try:
-            await client.copy_message(
-                chat_id=user["user_id"],
-                from_chat_id=message.chat.id,
-                message_id=message.reply_to_message.id
-            )
-            success += 1
-            await asyncio.sleep(0.1)  # Avoid flood
-        except:
-            failed += 1
+    if shard == 0:
+        # Resume broadcasts interrupted by a restart
+        for job in await broadcast.pending_jobs():
+            start_broadcast(app, job["_id"])
     
-    await status.edit(f"✅ **Broadcast Complete!**\n\n✅ Success: {success}\n❌ Failed: {failed}")
+    await supervisor.start(app, shard, exclude=MAIN_BOT_ONLY)
+
+async def shutdown():
+    """Stop the bot and release the connection pool"""
+    await supervisor.stop()
+    await indexer.live.stop()
+    await activity.stop()
+    await scheduler.stop()
+    await stats.stop()
+    await fuzzy.stop()
+    await catalog.stop()
+    dbmonitor.stop()
+    await sink.stop()
+    await app.stop()
+    database.close()
 
-# ==================== BOT RUNNER ====================
 async def main():
-    await app.start()
+    await startup()
     bot = await app.get_me()
     
     print("="*50)
     print(f"🤖 BOT STARTED: @{bot.username}")
-    print(f"👥 Users: {users_col.count_documents({})}")
-    print(f"📁 Files: {files_col.count_documents({})}")
+    print(f"👥 Users: {stats.snapshot['users']}")
+    print(f"📁 Files: {stats.snapshot['files']}")
     print(f"🔄 MongoDB: Connected")
     print(f"⚡ Force Sub: {'Enabled' if FSUB_CHANNELS else 'Disabled'}")
     print(f"👑 Admin: {ADMIN_ID}")
@@ -591,4 +1038,5 @@ async def main():
     print("="*50)
     
     await idle()
+    await shutdown()
     
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+from bson import ObjectId
+from pyrogram.errors import (
+    FloodWait, UserIsBlocked, InputUserDeactivated, PeerIdInvalid
+)
+from config import (
+    BROADCAST_WORKERS, BROADCAST_CHUNK, BROADCAST_PROGRESS_INTERVAL
+)
+from ratelimit import outgoing
+from database import broadcasts_col, users_col
+
+# Users who can never receive messages again; later broadcasts skip them
+BLOCKED = (UserIsBlocked, InputUserDeactivated)
+# PeerIdInvalid only means the session has no cached peer for the user
+# (e.g. after a redeploy lost the session file), so it is not permanent
+UNREACHABLE = (*BLOCKED, PeerIdInvalid)
+MAX_RETRIES = 3
+
+# ==================== JOBS ====================
+async def create_job(from_chat_id: int, message_id: int,
+                     status_chat_id: int, status_message_id: int) -> ObjectId:
+    """Persist a new broadcast job"""
+    total = await users_col.count_documents({"blocked": {"$ne": True}})
+    result = await broadcasts_col.insert_one({
+        "from_chat_id": from_chat_id,
+        "message_id": message_id,
+        "status_chat_id": status_chat_id,
+        "status_message_id": status_message_id,
+        "state": "running",
+        "cursor": None,
+        "total": total,
+        "success": 0,
+        "failed": 0,
+        "blocked": 0,
+        "created_at": datetime.now()
+    })
+    return result.inserted_id
+
+async def pending_jobs():
+    """Jobs interrupted by a restart"""
+    return await broadcasts_col.find({"state": "running"}).to_list(None)
+
+# ==================== SENDING ====================
+async def send_one(client, user_id: int, job: Dict) -> str:
+    """Deliver the job's message to one user: 'success', 'blocked' or 'failed'"""
+    for _ in range(MAX_RETRIES):
+        await outgoing.acquire()
+        try:
+            await client.copy_message(
+                chat_id=user_id,
+                from_chat_id=job["from_chat_id"],
+                message_id=job["message_id"]
+            )
+            return "success"
+        except FloodWait as e:
+            outgoing.pause(e.value)
+        except BLOCKED:
+            return "blocked"
+        except Exception:
+            return "failed"
+    return "failed"
+
+async def run_job(client, job_id: ObjectId,
+                  on_progress: Optional[Callable[[Dict], Awaitable]] = None) -> Dict:
+    """Run or resume a job from its cursor, a chunk of users at a time"""
+    job = await broadcasts_col.find_one({"_id": job_id})
+    senders = asyncio.Semaphore(BROADCAST_WORKERS)
+    started = last_report = time.monotonic()
+    sent_this_run = 0
+
+    async def send(user):
+        async with senders:
+            return user["user_id"], await send_one(client, user["user_id"], job)
+
+    while True:
+        query = {"blocked": {"$ne": True}}
+        if job["cursor"] is not None:
+            query["_id"] = {"$gt": job["cursor"]}
+        users = await users_col.find(query, {"user_id": 1}).sort("_id", 1) \
+            .limit(BROADCAST_CHUNK).to_list(BROADCAST_CHUNK)
+        if not users:
+            break
+
+        outcomes = await asyncio.gather(*[send(user) for user in users])
+        counts = {"success": 0, "failed": 0, "blocked": 0}
+        blocked = []
+        for user_id, outcome in outcomes:
+            counts[outcome] += 1
+            if outcome == "blocked":
+                blocked.append(user_id)
+
+        if blocked:
+            await users_col.update_many(
+                {"user_id": {"$in": blocked}},
+                {"$set": {"blocked": True, "blocked_at": datetime.now()}}
+            )
+        # Cursor moves only after the whole chunk is done, so a restart
+        # re-sends at most one chunk
+        job["cursor"] = users[-1]["_id"]
+        for key, value in counts.items():
+            job[key] += value
+        await broadcasts_col.update_one(
+            {"_id": job_id},
+            {"$set": {"cursor": job["cursor"]}, "$inc": counts}
+        )
+
+        sent_this_run += len(users)
+        now = time.monotonic()
+        if on_progress and now - last_report >= BROADCAST_PROGRESS_INTERVAL:
+            last_report = now
+            job["rate"] = sent_this_run / (now - started)
+            try:
+                await on_progress(job)
+            except Exception:
+                pass
+
+    elapsed = time.monotonic() - started
+    job["rate"] = sent_this_run / elapsed if elapsed else 0.0
+    job["state"] = "done"
+    await broadcasts_col.update_one(
+        {"_id": job_id},
+        {"$set": {"state": "done", "finished_at": datetime.now()}}
+    )
+    return job
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from config import CACHE_SIZE, CACHE_TTL, SHARED_CACHE_TTL
+from database import cache_col
+from search import normalize, tokenize
+
+# ==================== LRU ====================
+class LRUCache:
+    """In-process LRU with a size cap and per-entry expiry"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def items(self):
+        """Snapshot of live (key, value) pairs"""
+        now = time.monotonic()
+        return [(k, v) for k, (exp, v) in list(self._data.items()) if exp >= now]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+# ==================== SINGLE FLIGHT ====================
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight call"""
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        call = self.calls.get(key)
+        if call is not None:
+            self.coalesced += 1
+        else:
+            call = self.calls[key] = asyncio.ensure_future(fn())
+            call.add_done_callback(lambda _: self.calls.pop(key, None))
+        # A caller giving up must not cancel the call for everyone else
+        return await asyncio.shield(call)
+
+# ==================== RESULT CACHE ====================
+class ResultCache:
+    """Search results cached in-process first, then shared through cache_col"""
+
+    def __init__(self, max_size: int, ttl: float, shared_ttl: float):
+        self.local = LRUCache(max_size, ttl)
+        self.shared_ttl = shared_ttl
+        self.hits_local = 0
+        self.hits_shared = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def make_key(query: str, season: Optional[str] = None,
+                 quality: Optional[str] = None) -> str:
+        return f"{normalize(query)}|{season or ''}|{quality or ''}"
+
+    async def get(self, key: str) -> Optional[List[Dict]]:
+        entry = self.local.get(key)
+        if entry is not None:
+            self.hits_local += 1
+            return entry[1]
+
+        doc = await cache_col.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now()}},
+            {"terms": 1, "results": 1}
+        )
+        if doc is not None:
+            self.hits_shared += 1
+            self.local.set(key, (doc["terms"], doc["results"]))
+            return doc["results"]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, query: str, results: List[Dict]):
+        terms = tokenize(query)
+        self.local.set(key, (terms, results))
+        await cache_col.replace_one(
+            {"_id": key},
+            {
+                "terms": terms,
+                # A file can only match the query if it has this term too;
+                # the longest one is usually the rarest
+                "key_term": max(terms, key=len, default=""),
+                "results": results,
+                "expires_at": datetime.now() + timedelta(seconds=self.shared_ttl)
+            },
+            upsert=True
+        )
+
+    async def invalidate(self, file_terms: Iterable[Iterable[str]]):
+        """Drop cached queries that one of the changed files matches, i.e.
+        whose every term appears in that file's terms"""
+        file_terms = [set(terms) for terms in file_terms if terms]
+        if not file_terms:
+            return
+
+        def matches(entry_terms) -> bool:
+            entry_terms = set(entry_terms)
+            return any(entry_terms <= terms for terms in file_terms)
+
+        for key, (entry_terms, _) in self.local.items():
+            if matches(entry_terms):
+                self.local.pop(key)
+                self.invalidated += 1
+
+        stale = []
+        key_terms = list(set().union(*file_terms))
+        async for doc in cache_col.find({"key_term": {"$in": key_terms}}, {"terms": 1}):
+            if matches(doc["terms"]):
+                stale.append(doc["_id"])
+        if stale:
+            await cache_col.delete_many({"_id": {"$in": stale}})
+            self.invalidated += len(stale)
+
+    def stats(self) -> Dict:
+        lookups = self.hits_local + self.hits_shared + self.misses
+        hits = self.hits_local + self.hits_shared
+        return {
+            "size": len(self.local),
+            "hits_local": self.hits_local,
+            "hits_shared": self.hits_shared,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+result_cache = ResultCache(CACHE_SIZE, CACHE_TTL, SHARED_CACHE_TTL)
+search_flight = SingleFlight()
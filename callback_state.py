@@ -0,0 +1,42 @@
+import secrets
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from config import CALLBACK_STATE_TTL, CALLBACK_CACHE_SIZE
+from cache import LRUCache
+from database import callback_states_col
+
+# ==================== CALLBACK STATE ====================
+# Buttons carry only "cb_<key>"; the state behind a key lives here, in
+# memory first and in Mongo for restarts and other processes. This keeps
+# callback_data far below Telegram's 64-byte limit whatever the payload.
+PREFIX = "cb_"
+states = LRUCache(CALLBACK_CACHE_SIZE, CALLBACK_STATE_TTL)
+
+async def put_many(items: List[Dict]) -> List[str]:
+    """Store states (each with an "action") and return their callback_data"""
+    if not items:
+        return []
+    expires_at = datetime.now() + timedelta(seconds=CALLBACK_STATE_TTL)
+    docs = []
+    for state in items:
+        # 96 bits: collisions stay negligible across a day of buttons
+        key = secrets.token_hex(12)
+        states.set(key, state)
+        docs.append({"_id": key, "state": state, "expires_at": expires_at})
+    await callback_states_col.insert_many(docs, ordered=False)
+    return [PREFIX + doc["_id"] for doc in docs]
+
+async def resolve(callback_data: str) -> Optional[Dict]:
+    """State behind a button, or None once it has expired"""
+    key = callback_data[len(PREFIX):]
+    state = states.get(key)
+    if state is not None:
+        return state
+
+    doc = await callback_states_col.find_one(
+        {"_id": key, "expires_at": {"$gt": datetime.now()}}
+    )
+    if doc is None:
+        return None
+    states.set(key, doc["state"])
+    return doc["state"]
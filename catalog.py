@@ -0,0 +1,428 @@
+import asyncio
+import logging
+import os
+import pickle
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+from config import (
+    CATALOG_SNAPSHOT_PATH, CATALOG_SYNC_INTERVAL,
+    CATALOG_RECONCILE_INTERVAL, CATALOG_SNAPSHOT_INTERVAL
+)
+from database import files_col
+from search import CANDIDATE_LIMIT, rank_files, tokenize
+
+logger = logging.getLogger(__name__)
+
+LOAD_PROJECTION = {
+    "file_id": 1, "file_name": 1, "chat_id": 1, "message_id": 1,
+    "season": 1, "episode": 1, "quality": 1, "terms": 1
+}
+POLL_PROJECTION = {**LOAD_PROJECTION, "indexed_at": 1}
+LOAD_BATCH = 5000
+SNAPSHOT_VERSION = 1
+# Rebuild once this share of rows are replaced or deleted
+COMPACT_RATIO = 0.2
+# indexed_at is bumped by every write to a file and comes from the
+# writer's clock; re-read a margin when polling
+POLL_OVERLAP = timedelta(seconds=60)
+MEASURE_INTERVAL = 60
+MEASURE_SAMPLE = 1000
+
+def _contains(posting: array, row: int) -> bool:
+    i = bisect_left(posting, row)
+    return i < len(posting) and posting[i] == row
+
+# ==================== COLUMNS ====================
+class Catalog:
+    """In-process copy of files_col laid out column by column, with a term
+    posting list per search term. Rows are only appended: an updated file
+    gets a new row and its old one is marked dead until the next compaction."""
+
+    COLUMNS = ("oids", "file_ids", "names", "chat_ids", "message_ids",
+               "seasons", "episodes", "qualities", "live")
+
+    def __init__(self):
+        self._clear()
+        self.ready = False
+        self.source = None
+        self.load_seconds = None
+        self.synced_at: Optional[datetime] = None
+        self.change_stream = False
+        self.save_snapshots = True
+        self._memory = 0
+        self._measured_at = float("-inf")
+        self._frozen = False
+        self._freeze = asyncio.Lock()
+        self._deferred = []
+        # indexed_at of the files read by the last poll, to skip the unchanged
+        # ones the next poll's overlap reads again
+        self._polled: Dict[bytes, datetime] = {}
+        self._tasks = []
+
+    def _clear(self):
+        self.oids = bytearray()  # 12 bytes per row
+        self.file_ids: List[str] = []
+        self.names: List[str] = []
+        self.chat_ids = array("q")
+        self.message_ids = array("q")
+        self.seasons = array("B")  # 0 when none
+        self.episodes = array("h")  # -1 when none
+        self.qualities = array("B")  # index into quality_names
+        self.live = bytearray()
+        self.quality_names: List[Optional[str]] = [None]
+        self.postings: Dict[str, array] = {}
+        self.rows: Dict[bytes, int] = {}
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    # ==================== WRITES ====================
+    def add(self, doc: Dict):
+        """Insert or replace a file"""
+        if self._frozen:
+            self._deferred.append((self.add, doc))
+            return
+        key = doc["_id"].binary
+        old = self.rows.get(key)
+        if old is not None:
+            self._kill(old)
+
+        row = len(self.names)
+        self.rows[key] = row
+        self.oids += key
+        self.file_ids.append(doc.get("file_id") or "")
+        self.names.append(sys.intern(doc.get("file_name") or ""))
+        self.chat_ids.append(doc.get("chat_id") or 0)
+        self.message_ids.append(doc.get("message_id") or 0)
+        season = doc.get("season")
+        self.seasons.append(int(season[1:]) if season else 0)
+        episode = doc.get("episode")
+        self.episodes.append(episode if episode is not None else -1)
+        self.qualities.append(self._quality_id(doc.get("quality")))
+        self.live.append(1)
+        for term in doc.get("terms") or tokenize(doc.get("file_name")):
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[sys.intern(term)] = array("I")
+            posting.append(row)
+
+    def remove(self, oid: ObjectId):
+        if self._frozen:
+            self._deferred.append((self.remove, oid))
+            return
+        row = self.rows.pop(oid.binary, None)
+        if row is not None:
+            self._kill(row)
+
+    def _kill(self, row: int):
+        if self.live[row]:
+            self.live[row] = 0
+            self.dead += 1
+
+    def _quality_id(self, quality: Optional[str]) -> int:
+        if quality is None:
+            return 0
+        try:
+            return self.quality_names.index(quality)
+        except ValueError:
+            self.quality_names.append(sys.intern(quality))
+            return len(self.quality_names) - 1
+
+    # ==================== READS ====================
+    def file_doc(self, row: int) -> Dict:
+        """A row in the shape of a search result"""
+        season = self.seasons[row]
+        episode = self.episodes[row]
+        return {
+            "_id": ObjectId(bytes(self.oids[row * 12:row * 12 + 12])),
+            "file_id": self.file_ids[row],
+            "file_name": self.names[row],
+            "chat_id": self.chat_ids[row],
+            "message_id": self.message_ids[row],
+            "season": f"S{season:02d}" if season else None,
+            "episode": episode if episode >= 0 else None,
+            "quality": self.quality_names[self.qualities[row]]
+        }
+
+    def get_many(self, ids: List[ObjectId]) -> Dict[ObjectId, Dict]:
+        found = {}
+        for oid in ids:
+            row = self.rows.get(oid.binary)
+            if row is not None:
+                found[oid] = self.file_doc(row)
+        return found
+
+    def search(self, query: str, limit: int = 100, season: Optional[str] = None,
+               quality: Optional[str] = None) -> List[Dict]:
+        """Same matching and ranking as search_files, without a round trip"""
+        postings = []
+        for term in tokenize(query):
+            posting = self.postings.get(term)
+            if posting is None:
+                return []
+            postings.append(posting)
+        if not postings:
+            return []
+        quality_id = None
+        if quality:
+            if quality not in self.quality_names:
+                return []
+            quality_id = self.quality_names.index(quality)
+        season_no = int(season[1:]) if season else None
+
+        # Walk the rarest term; probe the others by binary search
+        postings.sort(key=len)
+        rows = []
+        for row in postings[0]:
+            if not self.live[row]:
+                continue
+            if season_no is not None and self.seasons[row] != season_no:
+                continue
+            if quality_id is not None and self.qualities[row] != quality_id:
+                continue
+            if all(_contains(posting, row) for posting in postings[1:]):
+                rows.append(row)
+                if len(rows) >= CANDIDATE_LIMIT:
+                    break
+        return rank_files([self.file_doc(row) for row in rows], query)[:limit]
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint of the columns, strings and postings; string
+        sizes are estimated from a sample and the figure is cached briefly"""
+        now = time.monotonic()
+        if now - self._measured_at < MEASURE_INTERVAL:
+            return self._memory
+        total = sum(sys.getsizeof(getattr(self, name)) for name in self.COLUMNS)
+        for strings in (self.names, self.file_ids):
+            if strings:
+                step = max(len(strings) // MEASURE_SAMPLE, 1)
+                sample = strings[::step]
+                total += len(strings) * sum(map(sys.getsizeof, sample)) // len(sample)
+        total += sys.getsizeof(self.postings)
+        total += sum(sys.getsizeof(term) + sys.getsizeof(posting)
+                     for term, posting in self.postings.items())
+        total += sys.getsizeof(self.rows) + len(self.rows) * sys.getsizeof(b"x" * 12)
+        self._memory, self._measured_at = total, now
+        return total
+
+    def stats(self) -> Dict:
+        return {
+            "files": len(self.rows),
+            "dead_rows": self.dead,
+            "terms": len(self.postings),
+            "memory_mb": round(self.memory_bytes() / 2**20, 1),
+            "load_seconds": self.load_seconds,
+            "source": self.source,
+            "change_stream": self.change_stream,
+            "synced_at": self.synced_at
+        }
+
+    # ==================== COMPACTION ====================
+    def _compacted(self) -> Dict:
+        """Live rows only, renumbered; reads the columns without changing them"""
+        keep = [row for row in range(len(self.live)) if self.live[row]]
+        renumber = array("I", bytes(4 * len(self.live)))
+        for new, row in enumerate(keep):
+            renumber[row] = new
+        postings = {}
+        for term, posting in self.postings.items():
+            rows = array("I", (renumber[row] for row in posting if self.live[row]))
+            if rows:
+                postings[term] = rows
+        oids = bytearray()
+        for row in keep:
+            oids += self.oids[row * 12:row * 12 + 12]
+        return {
+            "oids": oids,
+            "file_ids": [self.file_ids[row] for row in keep],
+            "names": [self.names[row] for row in keep],
+            "chat_ids": array("q", (self.chat_ids[row] for row in keep)),
+            "message_ids": array("q", (self.message_ids[row] for row in keep)),
+            "seasons": array("B", (self.seasons[row] for row in keep)),
+            "episodes": array("h", (self.episodes[row] for row in keep)),
+            "qualities": array("B", (self.qualities[row] for row in keep)),
+            "live": bytearray(b"\x01" * len(keep)),
+            "quality_names": self.quality_names,
+            "postings": postings
+        }
+
+    def _install(self, columns: Dict):
+        for name, value in columns.items():
+            setattr(self, name, value)
+        self.rows = {bytes(self.oids[i:i + 12]): i // 12 for i in range(0, len(self.oids), 12)}
+        self.dead = 0
+
+    async def _while_frozen(self, work, install=None):
+        """Run blocking work in a thread; writes arriving meanwhile are replayed
+        after, on top of whatever `install` puts in place from its result.
+        One freeze at a time: a second would unfreeze under the first."""
+        async with self._freeze:
+            self._frozen = True
+            try:
+                thread = asyncio.ensure_future(asyncio.to_thread(work))
+                try:
+                    result = await asyncio.shield(thread)
+                except asyncio.CancelledError:
+                    # The thread can't be stopped; keep the columns frozen
+                    # until it no longer reads them
+                    await asyncio.wait([thread])
+                    raise
+                if install is not None:
+                    install(result)
+                return result
+            finally:
+                self._frozen = False
+                deferred, self._deferred = self._deferred, []
+                for apply, arg in deferred:
+                    apply(arg)
+
+    async def compact(self):
+        await self._while_frozen(self._compacted, self._install)
+
+    # ==================== SNAPSHOT FILE ====================
+    def _write_snapshot(self, path: str):
+        data = {"version": SNAPSHOT_VERSION, "synced_at": self.synced_at, **self._compacted()}
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    async def save_snapshot(self, path: str = CATALOG_SNAPSHOT_PATH):
+        """Write the live rows to disk so the next start skips the full load"""
+        if path and self.ready and self.save_snapshots:
+            await self._while_frozen(lambda: self._write_snapshot(path))
+
+    def _read_snapshot(self, path: str) -> Optional[Dict]:
+        # Only ever a file this process wrote; not meant for untrusted input
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return data if data.get("version") == SNAPSHOT_VERSION else None
+
+    # ==================== SYNC ====================
+    async def load_from_mongo(self):
+        self._clear()
+        self.synced_at = datetime.now()
+        async for doc in files_col.find({}, LOAD_PROJECTION).batch_size(LOAD_BATCH):
+            self.add(doc)
+        self.source = "mongo"
+
+    async def load(self, path: str = CATALOG_SNAPSHOT_PATH):
+        """Load from the snapshot file and catch up, or read the whole collection"""
+        started = time.monotonic()
+        data = None
+        if path and os.path.exists(path):
+            try:
+                data = await asyncio.to_thread(self._read_snapshot, path)
+            except Exception:
+                logger.exception("Catalog snapshot %s unreadable", path)
+        if data:
+            self.synced_at = data.pop("synced_at")
+            data.pop("version")
+            self._install(data)
+            self.source = "snapshot"
+            await self.poll()
+            await self.reconcile()
+        else:
+            await self.load_from_mongo()
+        self.load_seconds = round(time.monotonic() - started, 2)
+        self._measured_at = float("-inf")
+        self.ready = True
+
+    async def poll(self):
+        """Apply files indexed or changed since the last sync"""
+        started = datetime.now()
+        since = self.synced_at - POLL_OVERLAP
+        polled = {}
+        async for doc in files_col.find({"indexed_at": {"$gte": since}}, POLL_PROJECTION):
+            key = doc["_id"].binary
+            polled[key] = doc.get("indexed_at")
+            # The overlap re-reads files the last poll already applied
+            if self._polled.get(key) != polled[key]:
+                self.add(doc)
+        self._polled = polled
+        self.synced_at = started
+
+    async def reconcile(self):
+        """Drop rows whose files were deleted; polling can't see deletes"""
+        seen = bytearray(len(self.live))
+        async for doc in files_col.find({}, {"_id": 1}).batch_size(LOAD_BATCH * 4):
+            row = self.rows.get(doc["_id"].binary)
+            if row is not None:
+                seen[row] = 1
+        for key, row in list(self.rows.items()):
+            if row < len(seen) and not seen[row]:
+                self.remove(ObjectId(key))
+
+    async def watch(self):
+        """Tail the change stream; needs a replica set"""
+        async with files_col.watch(full_document="updateLookup") as stream:
+            self.change_stream = True
+            # Cover writes between the load and the stream opening
+            await self.poll()
+            async for change in stream:
+                if change["operationType"] == "delete":
+                    self.remove(change["documentKey"]["_id"])
+                elif change.get("fullDocument"):
+                    self.add(change["fullDocument"])
+                if self.dead > COMPACT_RATIO * max(len(self.rows), 1):
+                    await self.compact()
+
+    async def _sync(self):
+        try:
+            await self.watch()
+        except OperationFailure:
+            logger.info("Change streams unavailable; polling files every %ss", CATALOG_SYNC_INTERVAL)
+        except Exception:
+            logger.exception("Catalog change stream stopped; polling instead")
+        self.change_stream = False
+
+        last_reconcile = time.monotonic()
+        while True:
+            await asyncio.sleep(CATALOG_SYNC_INTERVAL)
+            try:
+                await self.poll()
+                if time.monotonic() - last_reconcile >= CATALOG_RECONCILE_INTERVAL:
+                    last_reconcile = time.monotonic()
+                    await self.reconcile()
+                if self.dead > COMPACT_RATIO * max(len(self.rows), 1):
+                    await self.compact()
+            except Exception:
+                logger.exception("Catalog poll failed")
+
+    async def _snapshot_forever(self):
+        while True:
+            await asyncio.sleep(CATALOG_SNAPSHOT_INTERVAL)
+            try:
+                await self.save_snapshot()
+            except Exception:
+                logger.exception("Catalog snapshot failed")
+
+    async def start(self, save_snapshots: bool = True):
+        """Load and keep in sync; only one process should write the snapshot file"""
+        self.save_snapshots = save_snapshots
+        await self.load()
+        print(f"🧠 Catalog: {len(self)} files in {self.load_seconds}s "
+              f"from {self.source}, {self.stats()['memory_mb']} MB")
+        self._tasks = [
+            asyncio.create_task(self._sync()),
+            asyncio.create_task(self._snapshot_forever())
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.save_snapshot()
+        except Exception:
+            logger.exception("Catalog snapshot failed")
+
+catalog = Catalog()
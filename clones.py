@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Set, Tuple
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from config import API_ID, API_HASH, CLONES_PER_PROCESS, CLONE_SYNC_INTERVAL, DRAIN_TIMEOUT
+from database import clone_bots_col
+from scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 3600
+WORKER_STOP_TIMEOUT = DRAIN_TIMEOUT + 10
+
+# ==================== SUPERVISOR ====================
+class CloneSupervisor:
+    """Runs the clone bots of one shard inside this process, sharing its handlers,
+    database pool and caches. Shard 0 lives in the main bot process and also
+    assigns shards and spawns a worker process for every other shard."""
+
+    def __init__(self):
+        self.shard = 0
+        self.handlers: List[Tuple] = []
+        self.running: Dict[int, Tuple[str, Client]] = {}
+        self.retry_at: Dict[int, float] = {}
+        self.failures: Counter = Counter()
+        self.workers: Dict[int, asyncio.subprocess.Process] = {}
+        self._task = None
+
+    async def start(self, app: Client, shard: int = 0, exclude: Set[Callable] = frozenset()):
+        """Copy the main bot's handlers, except those whose callbacks are in
+        `exclude`, and start supervising clones"""
+        self.shard = shard
+        self.handlers = [
+            (handler, group)
+            for group, handlers in app.dispatcher.groups.items()
+            for handler in handlers
+            if handler.callback not in exclude
+        ]
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for user_id in list(self.running):
+            await self.stop_clone(user_id)
+        # Workers drain and flush their buffers on SIGTERM; give them the
+        # same time the main process allows itself before killing them
+        running = [p for p in self.workers.values() if p.returncode is None]
+        for process in running:
+            process.terminate()
+        for process in running:
+            try:
+                await asyncio.wait_for(process.wait(), WORKER_STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Clone worker %s did not exit; killing it", process.pid)
+                process.kill()
+                await process.wait()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Clone sync failed")
+            await asyncio.sleep(CLONE_SYNC_INTERVAL)
+
+    # ==================== SHARDING ====================
+    async def assign_shards(self) -> int:
+        """Give unassigned clones a shard with room; returns the shard count"""
+        counts = Counter()
+        unassigned = []
+        async for doc in clone_bots_col.find({"active": True}, {"shard": 1}):
+            if doc.get("shard") is None:
+                unassigned.append(doc["_id"])
+            else:
+                counts[doc["shard"]] += 1
+
+        for doc_id in unassigned:
+            shard = 0
+            while counts[shard] >= CLONES_PER_PROCESS:
+                shard += 1
+            counts[shard] += 1
+            await clone_bots_col.update_one({"_id": doc_id}, {"$set": {"shard": shard}})
+        return max(counts) + 1 if counts else 1
+
+    async def ensure_workers(self, shards: int):
+        """Keep one worker process running for every shard above 0"""
+        for shard in range(1, shards):
+            process = self.workers.get(shard)
+            if process is None or process.returncode is not None:
+                self.workers[shard] = await asyncio.create_subprocess_exec(
+                    sys.executable, __file__, "--shard", str(shard)
+                )
+
+    # ==================== CLONES ====================
+    async def sync(self):
+        """Start new or changed clones of this shard and stop removed ones"""
+        if self.shard == 0:
+            await self.ensure_workers(await self.assign_shards())
+
+        wanted = {}
+        async for doc in clone_bots_col.find({"active": True, "shard": self.shard}):
+            wanted[doc["user_id"]] = doc["token"]
+
+        for user_id in list(self.running):
+            token, _ = self.running[user_id]
+            if wanted.get(user_id) != token:
+                await self.stop_clone(user_id)
+
+        now = time.monotonic()
+        for user_id, token in wanted.items():
+            if user_id in self.running or self.retry_at.get(user_id, 0) > now:
+                continue
+            await self.start_clone(user_id, token)
+
+    async def start_clone(self, user_id: int, token: str):
+        """Start one clone; failures only delay that clone's next attempt"""
+        client = Client(
+            f"clone_{user_id}",
+            api_id=API_ID,
+            api_hash=API_HASH,
+            bot_token=token,
+            in_memory=True
+        )
+        for handler, group in self.handlers:
+            client.add_handler(handler, group)
+
+        try:
+            await client.start()
+        except FloodWait as e:
+            self.retry_at[user_id] = time.monotonic() + e.value
+            return
+        except Exception as e:
+            self.failures[user_id] += 1
+            backoff = min(30 * 2 ** self.failures[user_id], MAX_BACKOFF)
+            self.retry_at[user_id] = time.monotonic() + backoff
+            await clone_bots_col.update_one(
+                {"user_id": user_id},
+                {"$set": {"last_error": str(e), "last_error_at": datetime.now()}}
+            )
+            return
+
+        self.running[user_id] = (token, client)
+        self.failures.pop(user_id, None)
+        self.retry_at.pop(user_id, None)
+        await scheduler.register_client(client)
+        await clone_bots_col.update_one(
+            {"user_id": user_id},
+            {"$set": {"bot_id": client.me.id, "username": client.me.username,
+                      "started_at": datetime.now()},
+             "$unset": {"last_error": ""}}
+        )
+
+    async def stop_clone(self, user_id: int):
+        _, client = self.running.pop(user_id)
+        scheduler.unregister_client(client)
+        try:
+            await client.stop()
+        except Exception:
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            "running": len(self.running),
+            "workers": sum(1 for p in self.workers.values() if p.returncode is None),
+            "failing": len(self.failures)
+        }
+
+supervisor = CloneSupervisor()
+
+# ==================== WORKER PROCESS ====================
+async def run_worker(shard: int):
+    """Serve one shard of clones from a separate process until SIGTERM"""
+    import bot
+    import metrics
+    await bot.startup(shard=shard)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+        # Same graceful shutdown as app.py: let handlers finish, then flush
+        if not await metrics.inflight.drain(DRAIN_TIMEOUT):
+            logger.warning("%s handlers still running after %ss", metrics.inflight.count, DRAIN_TIMEOUT)
+    finally:
+        await bot.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clone bot worker")
+    parser.add_argument("--shard", type=int, required=True)
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.shard))
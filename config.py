@@ -0,0 +1,125 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ==================== BOT ====================
+API_ID = int(os.getenv("API_ID", 0))
+API_HASH = os.getenv("API_HASH", "")
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+ADMIN_ID = int(os.getenv("ADMIN_ID", 0))
+LOG_CHANNEL = int(os.getenv("LOG_CHANNEL", 0))
+FSUB_CHANNELS = [int(x) for x in os.getenv("FSUB_CHANNELS", "").split() if x]
+
+# ==================== DATABASE ====================
+MONGO_URL = os.getenv("MONGO_URL", "")
+MONGO_DB = os.getenv("MONGO_DB", "auto_filter_bot")
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 5000))
+
+# ==================== SEARCH ====================
+SEARCH_MODE = os.getenv("SEARCH_MODE", "index")  # "index", "memory" or legacy "regex"
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 100))
+
+# ==================== CACHE ====================
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", 2000))
+CACHE_TTL = int(os.getenv("CACHE_TTL", 120))
+SHARED_CACHE_TTL = int(os.getenv("SHARED_CACHE_TTL", 600))
+SNAPSHOT_TTL = int(os.getenv("SNAPSHOT_TTL", 1800))
+ITEMS_PER_PAGE = int(os.getenv("ITEMS_PER_PAGE", 8))
+
+# ==================== INDEXER ====================
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", 500))
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", 2))
+INDEX_PROGRESS_INTERVAL = int(os.getenv("INDEX_PROGRESS_INTERVAL", 10))
+SOURCE_CHANNELS = [int(x) for x in os.getenv("SOURCE_CHANNELS", "").split() if x]
+LIVE_INDEX_BATCH = int(os.getenv("LIVE_INDEX_BATCH", 100))
+LIVE_INDEX_INTERVAL = float(os.getenv("LIVE_INDEX_INTERVAL", 5))
+
+# ==================== BROADCAST ====================
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 10))
+BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", 200))
+BROADCAST_PROGRESS_INTERVAL = int(os.getenv("BROADCAST_PROGRESS_INTERVAL", 15))
+
+# ==================== FORCE SUBSCRIBE ====================
+FSUB_CACHE_SIZE = int(os.getenv("FSUB_CACHE_SIZE", 50000))
+FSUB_MEMBER_TTL = int(os.getenv("FSUB_MEMBER_TTL", 600))
+FSUB_NON_MEMBER_TTL = int(os.getenv("FSUB_NON_MEMBER_TTL", 30))
+
+# ==================== CALLBACK STATE ====================
+CALLBACK_STATE_TTL = int(os.getenv("CALLBACK_STATE_TTL", 86400))
+CALLBACK_CACHE_SIZE = int(os.getenv("CALLBACK_CACHE_SIZE", 20000))
+
+# ==================== SCHEDULER ====================
+SCHEDULER_BATCH_WINDOW = float(os.getenv("SCHEDULER_BATCH_WINDOW", 1))
+
+# ==================== STATS ====================
+STATS_FLUSH_INTERVAL = int(os.getenv("STATS_FLUSH_INTERVAL", 30))
+STATS_RECONCILE_INTERVAL = int(os.getenv("STATS_RECONCILE_INTERVAL", 3600))
+STATS_AGGREGATE_INTERVAL = int(os.getenv("STATS_AGGREGATE_INTERVAL", 900))
+QUERY_STATS_TTL = int(os.getenv("QUERY_STATS_TTL", 30 * 86400))
+
+# ==================== FUZZY SEARCH ====================
+FUZZY_MIN_HITS = int(os.getenv("FUZZY_MIN_HITS", 3))
+FUZZY_MIN_SCORE = float(os.getenv("FUZZY_MIN_SCORE", 0.45))
+FUZZY_BUDGET_MS = float(os.getenv("FUZZY_BUDGET_MS", 50))
+FUZZY_REFRESH_INTERVAL = int(os.getenv("FUZZY_REFRESH_INTERVAL", 300))
+
+# ==================== CLONES ====================
+CLONES_PER_PROCESS = int(os.getenv("CLONES_PER_PROCESS", 50))
+CLONE_SYNC_INTERVAL = int(os.getenv("CLONE_SYNC_INTERVAL", 30))
+
+# ==================== HTTP ====================
+PORT = int(os.getenv("PORT", 10000))
+HEALTH_MAX_LAG = float(os.getenv("HEALTH_MAX_LAG", 2))
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 25))
+
+# ==================== MONITORING ====================
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_QUERY_SAMPLE = float(os.getenv("SLOW_QUERY_SAMPLE", 0.1))
+# Explains re-run the query; at most one per interval
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", 30))
+
+# ==================== THROTTLE ====================
+THROTTLE_USER_RATE = float(os.getenv("THROTTLE_USER_RATE", 0.5))
+THROTTLE_USER_BURST = float(os.getenv("THROTTLE_USER_BURST", 5))
+THROTTLE_CHAT_RATE = float(os.getenv("THROTTLE_CHAT_RATE", 2))
+THROTTLE_CHAT_BURST = float(os.getenv("THROTTLE_CHAT_BURST", 20))
+THROTTLE_INLINE_RATE = float(os.getenv("THROTTLE_INLINE_RATE", 2))
+THROTTLE_INLINE_BURST = float(os.getenv("THROTTLE_INLINE_BURST", 10))
+THROTTLE_SEND_WAIT = float(os.getenv("THROTTLE_SEND_WAIT", 8))
+THROTTLE_QUEUE = int(os.getenv("THROTTLE_QUEUE", 3))
+# Every outgoing message shares this; Telegram allows bots ~30 msg/s
+SEND_RATE = float(os.getenv("SEND_RATE", os.getenv("BROADCAST_RATE", 25)))
+
+# ==================== USER ACTIVITY ====================
+ACTIVITY_FLUSH_INTERVAL = int(os.getenv("ACTIVITY_FLUSH_INTERVAL", 10))
+
+# ==================== IN-MEMORY CATALOG ====================
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "catalog.snapshot")
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", 5))
+CATALOG_RECONCILE_INTERVAL = int(os.getenv("CATALOG_RECONCILE_INTERVAL", 900))
+CATALOG_SNAPSHOT_INTERVAL = int(os.getenv("CATALOG_SNAPSHOT_INTERVAL", 1800))
+
+# ==================== SEND ALL ====================
+SEND_ALL_LIMIT = int(os.getenv("SEND_ALL_LIMIT", 100))
+DELIVERY_BATCH = int(os.getenv("DELIVERY_BATCH", 10))
+DELIVERY_USER_RATE = float(os.getenv("DELIVERY_USER_RATE", 1))
+DELIVERY_SESSION_TTL = int(os.getenv("DELIVERY_SESSION_TTL", 3600))
+DELIVERY_PROGRESS_INTERVAL = int(os.getenv("DELIVERY_PROGRESS_INTERVAL", 5))
+
+# ==================== LOG CHANNEL ====================
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 1000))
+LOG_FLUSH_INTERVAL = int(os.getenv("LOG_FLUSH_INTERVAL", 30))
+LOG_DIGEST_SIZE = int(os.getenv("LOG_DIGEST_SIZE", 50))
+
+# ==================== EXPORT / IMPORT ====================
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_CHUNK_DOCS = int(os.getenv("EXPORT_CHUNK_DOCS", 50000))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+
+# ==================== INLINE SEARCH ====================
+INLINE_PAGE_SIZE = min(int(os.getenv("INLINE_PAGE_SIZE", 50)), 50)  # Telegram caps an answer at 50
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 300))
+INLINE_DEADLINE = float(os.getenv("INLINE_DEADLINE", 10))
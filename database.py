@@ -0,0 +1,163 @@
+from datetime import datetime
+from typing import Dict, List
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+from config import (
+    MONGO_URL, MONGO_DB, MONGO_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE, MONGO_TIMEOUT_MS, QUERY_STATS_TTL
+)
+from dbmonitor import listener
+import search
+
+# ==================== CLIENT ====================
+# Motor runs pymongo on a bounded thread pool, so awaiting a query never
+# blocks the event loop. timeoutMS caps every operation, including time
+# spent waiting for a pooled connection.
+mongo = AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=MONGO_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=60000,
+    serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+    timeoutMS=MONGO_TIMEOUT_MS,
+    retryWrites=True,
+    appname="auto_filter_bot",
+    event_listeners=[listener]
+)
+db = mongo[MONGO_DB]
+users_col = db["users"]
+files_col = db["files"]
+clone_bots_col = db["clone_bots"]
+cache_col = db["cache"]
+snapshots_col = db["snapshots"]
+index_state_col = db["index_state"]
+broadcasts_col = db["broadcasts"]
+callback_states_col = db["callback_states"]
+scheduled_col = db["scheduled_actions"]
+stats_col = db["stats"]
+query_stats_col = db["query_stats"]
+titles_col = db["titles"]
+imports_col = db["imports"]
+
+async def ping() -> bool:
+    """Check that MongoDB answers"""
+    try:
+        await db.command("ping")
+        return True
+    except Exception:
+        return False
+
+async def ensure_indexes():
+    """Create indexes used by lookups and upserts"""
+    await users_col.create_index([("user_id", ASCENDING)], name="user_id")
+    await files_col.create_index([("file_id", ASCENDING)], name="file_id")
+    await files_col.create_index([("chat_id", ASCENDING), ("message_id", ASCENDING)],
+                                 name="chat_message")
+    await ensure_unique_files_index()
+    await files_col.create_index([("file_size", ASCENDING), ("name_key", ASCENDING)],
+                                 name="size_name")
+    await files_col.create_index([("sources", ASCENDING)], name="sources")
+    # Catalogs poll on it; every write that changes a file bumps it
+    await files_col.create_index([("indexed_at", ASCENDING)], name="indexed_at")
+    await clone_bots_col.create_index([("user_id", ASCENDING)], name="user_id")
+    await cache_col.create_index([("expires_at", ASCENDING)], name="expires_at_ttl",
+                                 expireAfterSeconds=0)
+    await cache_col.create_index([("key_term", ASCENDING)], name="key_term")
+    await snapshots_col.create_index([("expires_at", ASCENDING)], name="expires_at_ttl",
+                                     expireAfterSeconds=0)
+    await query_stats_col.create_index([("count", ASCENDING)], name="count")
+    # Queries nobody searched for a while drop out of the top list
+    await query_stats_col.create_index([("last_at", ASCENDING)], name="last_at_ttl",
+                                       expireAfterSeconds=QUERY_STATS_TTL)
+    await titles_col.create_index([("created_at", ASCENDING)], name="created_at")
+    await scheduled_col.create_index([("bot_id", ASCENDING)], name="bot_id")
+    await clone_bots_col.create_index([("active", ASCENDING), ("shard", ASCENDING)],
+                                      name="active_shard")
+    await callback_states_col.create_index([("expires_at", ASCENDING)], name="expires_at_ttl",
+                                           expireAfterSeconds=0)
+    await search.ensure_indexes(files_col)
+
+async def ensure_unique_files_index() -> bool:
+    """One canonical document per file_unique_id, so concurrent upserts can't
+    both insert. Files indexed before file_unique_id existed are left out.
+    False while duplicates remain; /dedup merges them and retries."""
+    info = await files_col.index_information()
+    if info.get("file_unique_id", {}).get("unique"):
+        return True
+    if "file_unique_id" in info:
+        await files_col.drop_index("file_unique_id")
+    try:
+        await files_col.create_index(
+            [("file_unique_id", ASCENDING)], name="file_unique_id", unique=True,
+            partialFilterExpression={"file_unique_id": {"$type": "string"}}
+        )
+        return True
+    except OperationFailure as e:
+        if e.code != 11000:
+            raise
+        await files_col.create_index([("file_unique_id", ASCENDING)], name="file_unique_id")
+        print("⚠️ Duplicate files found; run /dedup to merge them")
+        return False
+
+def close():
+    """Close the connection pool"""
+    mongo.close()
+
+# ==================== FILES ====================
+# One document per distinct file. The same file posted in several channels,
+# or re-uploaded, is one document whose `sources` lists every copy.
+LOCATION_FIELDS = ("file_id", "chat_id", "message_id")
+
+def source_of(doc: Dict) -> Dict:
+    """A file's location; key order matters for exact `sources` matches"""
+    return {"chat_id": doc["chat_id"], "message_id": doc["message_id"]}
+
+async def save_files(docs: List[Dict]):
+    """Upsert files into their canonical documents in one unordered bulk write"""
+    # Re-uploads get a new file_unique_id; match them by size and name instead
+    canonical = {}
+    sized = [doc for doc in docs if doc.get("file_size")]
+    if sized:
+        async for doc in files_col.find(
+            {"file_size": {"$in": list({d["file_size"] for d in sized})},
+             "name_key": {"$in": list({d["name_key"] for d in sized})}},
+            {"file_size": 1, "name_key": 1, "file_unique_id": 1}
+        ):
+            canonical.setdefault((doc["file_size"], doc["name_key"]), doc["file_unique_id"])
+
+    ops = []
+    for doc in docs:
+        unique_id = doc["file_unique_id"]
+        if doc.get("file_size"):
+            unique_id = canonical.setdefault((doc["file_size"], doc["name_key"]), unique_id)
+        fields = {k: v for k, v in doc.items() if k not in LOCATION_FIELDS and k != "file_unique_id"}
+        ops.append(UpdateOne(
+            {"file_unique_id": unique_id},
+            {"$set": fields,
+             "$setOnInsert": {k: doc[k] for k in LOCATION_FIELDS},
+             "$addToSet": {"sources": source_of(doc)}},
+            upsert=True
+        ))
+    return await files_col.bulk_write(ops, ordered=False)
+
+async def file_sources(file_id) -> List[Dict]:
+    """Every known location of a file document"""
+    doc = await files_col.find_one({"_id": file_id}, {"sources": 1, "chat_id": 1, "message_id": 1})
+    if doc is None:
+        return []
+    return doc.get("sources") or [source_of(doc)]
+
+# ==================== CLONE BOTS ====================
+async def save_clone_bot(user_id: int, token: str, owner: str) -> None:
+    """Store or replace a user's clone bot token"""
+    await clone_bots_col.update_one(
+        {"user_id": user_id},
+        {"$set": {
+            "token": token,
+            "created_at": datetime.now(),
+            "owner": owner,
+            "active": True
+        }},
+        upsert=True
+    )
@@ -0,0 +1,140 @@
+import asyncio
+import random
+import time
+from typing import Dict, Optional
+from pymongo import monitoring
+from config import SLOW_QUERY_MS, SLOW_QUERY_SAMPLE, SLOW_QUERY_EXPLAIN_INTERVAL
+from logsink import sink
+import metrics
+
+# Commands whose first value is not a collection name
+SKIP = {"ping", "hello", "ismaster", "isMaster", "buildInfo", "endSessions", "explain"}
+EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+QUEUE_SIZE = 100
+
+command_latency = metrics.Histogram("mongo_command_seconds", "MongoDB command run time")
+command_errors = metrics.Counter("mongo_command_errors_total", "Failed MongoDB commands")
+docs_returned = metrics.Counter("mongo_documents_returned_total", "Documents returned by MongoDB")
+docs_examined = metrics.Counter(
+    "mongo_documents_examined_total",
+    "Documents examined by explained slow queries; a sample, not a total"
+)
+explains = metrics.Counter("mongo_explains_total", "Slow queries re-run with explain")
+slow_queries = metrics.Counter("mongo_slow_queries_total", "Commands slower than SLOW_QUERY_MS")
+
+# ==================== LISTENER ====================
+class CommandMonitor(monitoring.CommandListener):
+    """Times every command Motor sends. pymongo calls this from Motor's worker
+    threads, so slow queries are handed to the event loop for logging."""
+
+    def __init__(self):
+        self.pending: Dict[int, tuple] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queue: Optional[asyncio.Queue] = None
+
+    def _collection(self, event) -> str:
+        name = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            name = event.command.get("collection")
+        return name if isinstance(name, str) else ""
+
+    def started(self, event):
+        if event.command_name in SKIP:
+            return
+        self.pending[event.request_id] = (self._collection(event), event.command)
+
+    def succeeded(self, event):
+        info = self.pending.pop(event.request_id, None)
+        if info is None:
+            return
+        collection, command = info
+        seconds = event.duration_micros / 1e6
+        command_latency.observe(seconds, collection=collection, command=event.command_name)
+
+        reply = event.reply or {}
+        cursor = reply.get("cursor") or {}
+        returned = len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+        if returned:
+            docs_returned.inc(returned, collection=collection)
+
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            slow_queries.inc(collection=collection, command=event.command_name)
+            if random.random() < SLOW_QUERY_SAMPLE:
+                self._hand_off(collection, event.command_name, command, seconds)
+
+    def failed(self, event):
+        info = self.pending.pop(event.request_id, None)
+        if info is None:
+            return
+        command_errors.inc(collection=info[0], command=event.command_name)
+
+    def _hand_off(self, collection: str, name: str, command: Dict, seconds: float):
+        if self.loop is None or self.loop.is_closed():
+            return
+        entry = (collection, name, command, seconds)
+        self.loop.call_soon_threadsafe(self._enqueue, entry)
+
+    def _enqueue(self, entry):
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            pass
+
+listener = CommandMonitor()
+
+# ==================== SLOW QUERY LOG ====================
+def _explainable(command: Dict) -> Dict:
+    """The user-visible part of a command; drops session and routing fields"""
+    return {
+        key: value for key, value in command.items()
+        if not key.startswith("$") and key not in ("lsid", "txnNumber")
+    }
+
+_last_explain = float("-inf")
+
+async def _docs_examined(db, collection: str, name: str, command: Dict) -> Optional[int]:
+    """Re-run a slow query with explain. It adds load while the database is
+    already slow, so at most one runs per SLOW_QUERY_EXPLAIN_INTERVAL."""
+    global _last_explain
+    if name not in EXPLAINABLE:
+        return None
+    now = time.monotonic()
+    if now - _last_explain < SLOW_QUERY_EXPLAIN_INTERVAL:
+        return None
+    _last_explain = now
+    explains.inc(collection=collection)
+    try:
+        plan = await db.command({"explain": _explainable(command), "verbosity": "executionStats"})
+    except Exception:
+        return None
+    return plan.get("executionStats", {}).get("totalDocsExamined")
+
+async def log_slow_queries(db):
+    """Explain sampled slow queries and send them to the log channel digest"""
+    while True:
+        collection, name, command, seconds = await listener.queue.get()
+        examined = await _docs_examined(db, collection, name, command)
+        if examined is not None:
+            docs_examined.inc(examined, collection=collection)
+        filter_text = str(command.get("filter") or command.get("pipeline") or "")[:200]
+        sink.emit("slow_query", (
+            f"`{name}` on `{collection}` ⏱ {seconds * 1000:.0f} ms"
+            + (f" • 📄 {examined} examined (explain sample)" if examined is not None else "")
+            + f" `{filter_text}`"
+        ))
+
+_task = None
+
+def start(db):
+    """Bind the listener to this loop and start the slow query logger"""
+    global _task
+    listener.loop = asyncio.get_running_loop()
+    listener.queue = asyncio.Queue(QUEUE_SIZE)
+    _task = asyncio.create_task(log_slow_queries(db))
+
+def stop():
+    global _task
+    listener.loop = None
+    if _task:
+        _task.cancel()
+        _task = None
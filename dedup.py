@@ -0,0 +1,140 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import DeleteMany, UpdateOne
+from pyrogram.file_id import FileId, FileUniqueId, FileUniqueType
+from cache import result_cache
+import database
+import stats
+
+BATCH = 500
+
+# ==================== COMPACTION ====================
+# One-off merge of duplicates indexed before files were deduplicated at
+# index time: copies sharing a file_unique_id (derived from file_id for
+# files indexed without one), re-uploads sharing size and normalized name,
+# and pre-dedup documents for posts a canonical file lists.
+
+def merge_ops(docs: List[Dict], fields: Optional[Dict] = None) -> List:
+    """Fold a group of duplicates into its first document, or the oldest one
+    when none is canonical yet. Extras are deleted before the keeper takes
+    `fields`, so an ordered write never trips the unique index."""
+    docs.sort(key=lambda doc: (not doc.get("file_unique_id"), doc["_id"]))
+    keeper, extras = docs[0], docs[1:]
+    sources = []
+    for doc in docs:
+        for source in doc.get("sources") or [database.source_of(doc)]:
+            if source not in sources:
+                sources.append(source)
+    ops = [DeleteMany({"_id": {"$in": [doc["_id"] for doc in extras]}})] if extras else []
+    ops.append(UpdateOne({"_id": keeper["_id"]},
+                         {"$set": {**(fields or {}), "sources": sources, "indexed_at": datetime.now()}}))
+    return ops
+
+def unique_id_of(file_id: str) -> Optional[str]:
+    """The file_unique_id Telegram would report for a document or video file_id"""
+    try:
+        media_id = FileId.decode(file_id).media_id
+        return FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=media_id).encode()
+    except Exception:
+        return None
+
+async def _assign_unique_ids(report: Dict):
+    """Give files indexed before file_unique_id existed the id their file_id
+    encodes, folding them into the canonical file when there already is one"""
+    col = database.files_col
+    projection = {"file_id": 1, "file_unique_id": 1, "sources": 1,
+                  "chat_id": 1, "message_id": 1, "terms": 1}
+    batch = []
+
+    async def assign(batch):
+        groups: Dict[str, List[Dict]] = {}
+        for doc in batch:
+            unique_id = unique_id_of(doc.get("file_id"))
+            if unique_id:
+                groups.setdefault(unique_id, []).append(doc)
+        async for doc in col.find({"file_unique_id": {"$in": list(groups)}}, projection):
+            groups[doc["file_unique_id"]].append(doc)
+        ops = []
+        file_terms = []
+        for unique_id, docs in groups.items():
+            if len(docs) > 1:
+                report["groups"] += 1
+                report["removed"] += len(docs) - 1
+                file_terms.extend(doc.get("terms", []) for doc in docs)
+            ops.extend(merge_ops(docs, {"file_unique_id": unique_id}))
+        if ops:
+            await col.bulk_write(ops, ordered=True)
+            await result_cache.invalidate(file_terms)
+
+    async for doc in col.find({"file_unique_id": {"$exists": False}}, projection).batch_size(BATCH):
+        batch.append(doc)
+        if len(batch) >= BATCH:
+            await assign(batch)
+            batch = []
+    if batch:
+        await assign(batch)
+
+async def _merge_groups(match: Dict, group_key, report: Dict):
+    col = database.files_col
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": group_key, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    ops = []
+    file_terms = []
+    async for group in col.aggregate(pipeline, allowDiskUse=True):
+        docs = await col.find(
+            {"_id": {"$in": group["ids"]}},
+            {"sources": 1, "chat_id": 1, "message_id": 1, "terms": 1}
+        ).to_list(None)
+        file_terms.extend(doc.get("terms", []) for doc in docs)
+        ops.extend(merge_ops(docs))
+        report["groups"] += 1
+        report["removed"] += len(docs) - 1
+        if len(ops) >= BATCH:
+            await col.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await col.bulk_write(ops, ordered=False)
+    await result_cache.invalidate(file_terms)
+
+async def _drop_superseded(report: Dict):
+    """Delete pre-dedup documents whose post is already a canonical file's source"""
+    col = database.files_col
+    batch = []
+
+    async def check(batch):
+        wanted = [database.source_of(doc) for doc in batch]
+        covered = set()
+        async for doc in col.find({"sources": {"$in": wanted}}, {"sources": 1}):
+            covered.update((s["chat_id"], s["message_id"]) for s in doc["sources"])
+        stale = [doc["_id"] for doc in batch if (doc["chat_id"], doc["message_id"]) in covered]
+        if stale:
+            result = await col.delete_many({"_id": {"$in": stale}})
+            report["removed"] += result.deleted_count
+
+    async for doc in col.find({"sources": {"$exists": False}}, {"chat_id": 1, "message_id": 1}):
+        batch.append(doc)
+        if len(batch) >= BATCH:
+            await check(batch)
+            batch = []
+    if batch:
+        await check(batch)
+
+async def compact_duplicates() -> Dict:
+    """Merge duplicate files; returns how many groups were merged and docs removed"""
+    report = {"groups": 0, "removed": 0}
+    await _assign_unique_ids(report)
+    await _merge_groups({"file_unique_id": {"$type": "string"}}, "$file_unique_id", report)
+    await _merge_groups(
+        {"file_size": {"$gt": 0}, "name_key": {"$type": "string"}},
+        {"size": "$file_size", "name": "$name_key"},
+        report
+    )
+    await _drop_superseded(report)
+    if report["removed"]:
+        await stats.incr("files", -report["removed"])
+    # Possible once no duplicates are left
+    await database.ensure_unique_files_index()
+    return report
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Set, Tuple
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from config import (
+    DELIVERY_BATCH, DELIVERY_USER_RATE,
+    DELIVERY_SESSION_TTL, DELIVERY_PROGRESS_INTERVAL
+)
+from broadcast import UNREACHABLE
+from cache import LRUCache
+from ratelimit import TokenBucket, outgoing
+import database
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 3
+SESSION_CACHE_SIZE = 20000
+
+_user_buckets = LRUCache(SESSION_CACHE_SIZE, DELIVERY_SESSION_TTL)
+# (chat_id, message_id) of files each user already received this session
+_sent = LRUCache(SESSION_CACHE_SIZE, DELIVERY_SESSION_TTL)
+_jobs: Dict[int, Dict] = {}
+
+# ==================== SINGLE FILE ====================
+async def deliver_file(client, user_id: int, state: Dict) -> bool:
+    """Copy a file to the user, trying its other sources if a copy is gone.
+    Delivered files count as sent for the user's later Send all taps."""
+    if await _copy_file(client, user_id, state):
+        sent_files(user_id).add((state["chat_id"], state["message_id"]))
+        return True
+    return False
+
+async def _copy_file(client, user_id: int, state: Dict) -> bool:
+    # Every copy attempt is an outgoing message under the bot's global limit
+    await outgoing.acquire()
+    try:
+        await client.copy_message(user_id, state["chat_id"], state["message_id"])
+        return True
+    except (FloodWait, *UNREACHABLE):
+        # Waiting is the caller's call; for an unreachable user another source won't help
+        raise
+    except Exception:
+        logger.warning("Copy from %s/%s failed", state["chat_id"], state["message_id"])
+
+    for source in await database.file_sources(state.get("file")):
+        if (source["chat_id"], source["message_id"]) == (state["chat_id"], state["message_id"]):
+            continue
+        await outgoing.acquire()
+        try:
+            await client.copy_message(user_id, source["chat_id"], source["message_id"])
+            return True
+        except Exception:
+            continue
+    return False
+
+def sent_files(user_id: int) -> Set[Tuple[int, int]]:
+    sent = _sent.get(user_id)
+    if sent is None:
+        sent = set()
+    # Re-set on every use so an active session doesn't expire
+    _sent.set(user_id, sent)
+    return sent
+
+# ==================== BATCHES ====================
+async def copy_batch(client, user_id: int, chat_id: int, message_ids: List[int]):
+    """Copy up to 100 posts of one chat in a single ForwardMessages call;
+    drop_author sends them as copies, like copy_message"""
+    await client.invoke(raw.functions.messages.ForwardMessages(
+        from_peer=await client.resolve_peer(chat_id),
+        id=message_ids,
+        random_id=[client.rnd_id() for _ in message_ids],
+        to_peer=await client.resolve_peer(user_id),
+        drop_author=True
+    ))
+
+def batches(files: List[Dict]) -> List[List[Dict]]:
+    """Consecutive files from the same chat, at most DELIVERY_BATCH at a time.
+    A batch takes one token per file at once, so it can't outgrow the buckets."""
+    size = max(int(min(DELIVERY_BATCH, outgoing.capacity)), 1)
+    result = []
+    for file in files:
+        if result and len(result[-1]) < size and result[-1][0]["chat_id"] == file["chat_id"]:
+            result[-1].append(file)
+        else:
+            result.append([file])
+    return result
+
+async def send_batch(client, user_id: int, files: List[Dict]) -> List[Dict]:
+    """Deliver one batch, waiting out FloodWaits; falls back to one by one.
+    Returns the files that were delivered."""
+    user_bucket = _user_buckets.get(user_id)
+    if user_bucket is None:
+        user_bucket = TokenBucket(DELIVERY_USER_RATE, DELIVERY_BATCH)
+    _user_buckets.set(user_id, user_bucket)
+
+    for _ in range(MAX_RETRIES):
+        await user_bucket.acquire(len(files))
+        await outgoing.acquire(len(files))
+        try:
+            await copy_batch(client, user_id, files[0]["chat_id"],
+                             [file["message_id"] for file in files])
+            return files
+        except FloodWait as e:
+            outgoing.pause(e.value)
+            user_bucket.pause(e.value)
+        except UNREACHABLE:
+            raise
+        except Exception:
+            # A missing post fails the whole call; retry each file with its sources
+            break
+
+    delivered = []
+    for file in files:
+        for _ in range(MAX_RETRIES):
+            try:
+                if await deliver_file(client, user_id, {"file": file["_id"], **file}):
+                    delivered.append(file)
+                break
+            except FloodWait as e:
+                outgoing.pause(e.value)
+    return delivered
+
+# ==================== JOBS ====================
+def progress_text(job: Dict, done: bool = False) -> str:
+    header = "✅ **All files sent!**" if done else "📤 **Sending files...**"
+    text = f"{header}\n\n📁 {job['sent']}/{job['total']} delivered"
+    if job["skipped"]:
+        text += f"\n♻️ {job['skipped']} already sent earlier"
+    if job["failed"]:
+        text += f"\n❌ {job['failed']} failed"
+    return text
+
+async def send_all(client, user_id: int, files: List[Dict]) -> int:
+    """Queue files for delivery to the user's PM; returns how many were queued.
+    A running delivery for the same user picks up the new files. Raises
+    UNREACHABLE if the user can't be messaged."""
+    sent = sent_files(user_id)
+    job = _jobs.get(user_id)
+    queued = job["keys"] if job else set()
+    new = []
+    for file in files:
+        key = (file["chat_id"], file["message_id"])
+        if key not in sent and key not in queued:
+            queued.add(key)
+            new.append(file)
+    if not new:
+        return 0
+
+    if job:
+        job["files"].extend(new)
+        job["total"] += len(new)
+        job["skipped"] += len(files) - len(new)
+        return len(new)
+
+    job = _jobs[user_id] = {
+        "files": new, "keys": queued, "total": len(new), "sent": 0,
+        "skipped": len(files) - len(new), "failed": 0
+    }
+    # The status message doubles as a reachability check: users who never
+    # started the bot get UNREACHABLE here instead of a promise of files
+    try:
+        status = await client.send_message(user_id, progress_text(job))
+    except BaseException:
+        _jobs.pop(user_id, None)
+        raise
+    job["task"] = asyncio.create_task(_run(client, user_id, job, status))
+    return len(new)
+
+async def _run(client, user_id: int, job: Dict, status):
+    sent = sent_files(user_id)
+    last_report = 0.0
+    try:
+        while job["files"]:
+            pending, job["files"] = job["files"], []
+            for batch in batches(pending):
+                delivered = await send_batch(client, user_id, batch)
+                job["sent"] += len(delivered)
+                job["failed"] += len(batch) - len(delivered)
+                sent.update((file["chat_id"], file["message_id"]) for file in delivered)
+
+                now = time.monotonic()
+                if now - last_report >= DELIVERY_PROGRESS_INTERVAL:
+                    last_report = now
+                    try:
+                        await status.edit_text(progress_text(job))
+                    except Exception:
+                        pass
+        await status.edit_text(progress_text(job, done=True))
+    except UNREACHABLE:
+        logger.info("Delivery to %s stopped: user blocked the bot", user_id)
+    except Exception:
+        logger.exception("Delivery to %s failed", user_id)
+    finally:
+        _jobs.pop(user_id, None)
+
+def stats() -> Dict:
+    return {
+        "jobs": len(_jobs),
+        "queued": sum(len(job["files"]) for job in _jobs.values())
+    }
@@ -0,0 +1,59 @@
+import asyncio
+from typing import Dict
+from pyrogram.enums import ChatMemberStatus
+from pyrogram.errors import UserNotParticipant
+from config import FSUB_CHANNELS, FSUB_CACHE_SIZE, FSUB_MEMBER_TTL, FSUB_NON_MEMBER_TTL
+from cache import LRUCache
+
+# ==================== MEMBERSHIP CACHE ====================
+# (user_id, channel) -> bool. Members are cached longer than non-members so
+# someone who just joined is let through quickly.
+memberships = LRUCache(FSUB_CACHE_SIZE, FSUB_MEMBER_TTL)
+NOT_MEMBER = (ChatMemberStatus.LEFT, ChatMemberStatus.BANNED)
+
+api_calls = 0
+calls_saved = 0
+
+def remember(user_id: int, channel: int, is_member: bool):
+    ttl = FSUB_MEMBER_TTL if is_member else FSUB_NON_MEMBER_TTL
+    memberships.set((user_id, channel), is_member, ttl)
+
+async def is_member(client, channel: int, user_id: int) -> bool:
+    """Membership of one channel, answered from the cache when possible"""
+    global api_calls, calls_saved
+    cached = memberships.get((user_id, channel))
+    if cached is not None:
+        calls_saved += 1
+        return cached
+
+    api_calls += 1
+    try:
+        member = await client.get_chat_member(channel, user_id)
+        joined = member.status not in NOT_MEMBER
+    except UserNotParticipant:
+        joined = False
+    except Exception:
+        # Can't verify (e.g. bot lost admin rights): let the user through uncached
+        return True
+    remember(user_id, channel, joined)
+    return joined
+
+async def is_subscribed(client, user_id: int) -> bool:
+    """True if the user is in every force-subscribe channel"""
+    if not FSUB_CHANNELS:
+        return True
+    results = await asyncio.gather(*[
+        is_member(client, channel, user_id) for channel in FSUB_CHANNELS
+    ])
+    return all(results)
+
+def on_member_update(update):
+    """Refresh the cache from a join/leave update in an fsub channel"""
+    member = update.new_chat_member or update.old_chat_member
+    if not member or not member.user:
+        return
+    joined = bool(update.new_chat_member) and update.new_chat_member.status not in NOT_MEMBER
+    remember(member.user.id, update.chat.id, joined)
+
+def stats() -> Dict:
+    return {"api_calls": api_calls, "calls_saved": calls_saved, "cached": len(memberships)}
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+from pymongo import UpdateOne
+from config import FUZZY_BUDGET_MS, FUZZY_REFRESH_INTERVAL
+from database import files_col, titles_col
+from search import normalize
+
+logger = logging.getLogger(__name__)
+
+CANDIDATES = 20
+_refresh_task = None
+
+# ==================== TRIGRAMS ====================
+def trigrams(text: str) -> List[str]:
+    """Character trigrams of a normalized title, padded to weight word edges"""
+    padded = f"  {text} "
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)
+            ))
+        previous = current
+    return previous[-1]
+
+# ==================== INDEX ====================
+class TrigramIndex:
+    """Compact in-memory trigram index over distinct titles"""
+
+    def __init__(self):
+        self.titles: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.gram_counts = array("H")
+        self.postings: Dict[str, array] = {}
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, title: str):
+        if not title or title in self.ids:
+            return
+        title_id = len(self.titles)
+        self.ids[title] = title_id
+        self.titles.append(title)
+        grams = trigrams(title)
+        self.gram_counts.append(min(len(grams), 65535))
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array("I")
+            posting.append(title_id)
+
+    def search(self, query: str, limit: int = 3,
+               budget_ms: float = FUZZY_BUDGET_MS) -> List[Tuple[str, float]]:
+        """Titles most similar to the query, best first, within the time budget"""
+        deadline = time.perf_counter() + budget_ms / 1000
+        grams = [gram for gram in trigrams(query) if gram in self.postings]
+        if not grams:
+            return []
+
+        # Rarest grams first, so a blown budget still leaves the strongest signal
+        grams.sort(key=lambda gram: len(self.postings[gram]))
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for title_id in self.postings[gram]:
+                shared[title_id] = shared.get(title_id, 0) + 1
+            if time.perf_counter() > deadline:
+                break
+
+        query_grams = len(trigrams(query))
+        candidates = sorted(
+            shared.items(),
+            key=lambda item: -2 * item[1] / (query_grams + self.gram_counts[item[0]])
+        )[:CANDIDATES]
+
+        scored = []
+        for title_id, common in candidates:
+            title = self.titles[title_id]
+            dice = 2 * common / (query_grams + self.gram_counts[title_id])
+            distance = edit_distance(query, title)
+            similarity = 1 - distance / max(len(query), len(title))
+            scored.append((title, round(0.5 * dice + 0.5 * similarity, 3)))
+            if time.perf_counter() > deadline:
+                break
+        scored.sort(key=lambda item: -item[1])
+        return scored[:limit]
+
+index = TrigramIndex()
+
+# ==================== PERSISTENCE ====================
+async def add_titles(titles: Iterable[str]):
+    """Record titles seen at index time in Mongo and in the in-memory index"""
+    titles = {title for title in titles if title}
+    if not titles:
+        return
+    now = datetime.now()
+    await titles_col.bulk_write([
+        UpdateOne(
+            {"_id": title},
+            {"$setOnInsert": {"trigrams": trigrams(title), "created_at": now}},
+            upsert=True
+        )
+        for title in titles
+    ], ordered=False)
+    for title in titles:
+        index.add(title)
+
+async def rebuild_titles() -> int:
+    """Create title entries for every distinct title in the files collection"""
+    titles = []
+    async for doc in files_col.aggregate([
+        {"$match": {"title": {"$type": "string"}}},
+        {"$group": {"_id": "$title"}}
+    ], allowDiskUse=True):
+        titles.append(doc["_id"])
+        if len(titles) >= 1000:
+            await add_titles(titles)
+            titles = []
+    await add_titles(titles)
+    return len(index)
+
+async def load(since: datetime = None):
+    """Load titles into memory, or only those added since a time"""
+    query = {"created_at": {"$gt": since}} if since else {}
+    started = datetime.now()
+    async for doc in titles_col.find(query, {"_id": 1}):
+        index.add(doc["_id"])
+    index.loaded_at = started
+
+async def refresh_forever():
+    """Pick up titles indexed by other processes"""
+    while True:
+        await asyncio.sleep(FUZZY_REFRESH_INTERVAL)
+        try:
+            await load(since=index.loaded_at)
+        except Exception:
+            logger.exception("Title refresh failed")
+
+async def start():
+    global _refresh_task
+    await load()
+    _refresh_task = asyncio.create_task(refresh_forever())
+
+async def stop():
+    global _refresh_task
+    if _refresh_task:
+        _refresh_task.cancel()
+        _refresh_task = None
+
+def suggest(query: str, limit: int = 3) -> List[Tuple[str, float]]:
+    """'Did you mean' titles for a query"""
+    return index.search(normalize(query), limit)
@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from pymongo import DeleteOne, UpdateOne
+from pyrogram.errors import FloodWait
+from config import (
+    INDEX_BATCH_SIZE, INDEX_WORKERS, INDEX_PROGRESS_INTERVAL,
+    LIVE_INDEX_BATCH, LIVE_INDEX_INTERVAL
+)
+from cache import result_cache
+from metadata import file_fields
+from search import normalize
+import database
+import fuzzy
+import stats
+
+logger = logging.getLogger(__name__)
+
+# ==================== DOCUMENTS ====================
+def build_file_doc(msg, chat_id: int) -> Optional[Dict]:
+    """Files document for a channel post, or None if it carries no file"""
+    media = msg.video or msg.document
+    if not media:
+        return None
+    file_name = media.file_name or msg.caption or f"file_{msg.id}"
+    return {
+        "file_id": media.file_id,
+        "file_unique_id": media.file_unique_id,
+        "file_size": media.file_size,
+        "name_key": normalize(file_name),
+        "file_name": file_name.lower(),
+        "chat_id": chat_id,
+        "message_id": msg.id,
+        "caption": msg.caption or "",
+        "indexed_at": datetime.now(),
+        **file_fields(file_name, msg.caption)
+    }
+
+# ==================== WRITE BUFFER ====================
+class FileWriteBuffer:
+    """Collects file documents and writes them as unordered bulk upserts"""
+
+    def __init__(self, batch_size: int = INDEX_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.docs: List[Dict] = []
+        self.written = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def full(self) -> bool:
+        return len(self.docs) >= self.batch_size
+
+    def add(self, doc: Dict):
+        self.docs.append(doc)
+
+    async def flush(self) -> int:
+        """Write buffered documents and drop cached searches they now match"""
+        if not self.docs:
+            return 0
+        docs, self.docs = self.docs, []
+        result = await database.save_files(docs)
+        await stats.incr("files", result.upserted_count)
+
+        await result_cache.invalidate(doc["terms"] for doc in docs)
+        await fuzzy.add_titles(doc["title"] for doc in docs)
+
+        self.written += len(docs)
+        return len(docs)
+
+# ==================== CHECKPOINTS ====================
+async def get_checkpoint(channel_id: int) -> Tuple[int, int]:
+    """Last message id already indexed for a channel, and its newest known post"""
+    state = await database.index_state_col.find_one({"_id": channel_id}) or {}
+    return state.get("last_message_id", 0), state.get("top_message_id", 0)
+
+async def save_top(channel_id: int, top_message_id: int):
+    """Remember a channel's newest post so catch-up runs know where to stop"""
+    await database.index_state_col.update_one(
+        {"_id": channel_id}, {"$max": {"top_message_id": top_message_id}}, upsert=True
+    )
+
+async def save_checkpoint(channel_id: int, last_message_id: int, files: int):
+    await database.index_state_col.update_one(
+        {"_id": channel_id},
+        {"$set": {"last_message_id": last_message_id, "updated_at": datetime.now()},
+         "$inc": {"files": files}},
+        upsert=True
+    )
+
+async def reset_checkpoint(channel_id: int):
+    """Start the next run from the first message; the newest known post is kept"""
+    await database.index_state_col.update_one(
+        {"_id": channel_id}, {"$unset": {"last_message_id": "", "files": ""}}
+    )
+
+# ==================== PIPELINE ====================
+_workers = asyncio.Semaphore(INDEX_WORKERS)
+_running = set()
+
+def is_running(channel_id: int) -> bool:
+    return channel_id in _running
+
+# Bots can't read chat history, but may fetch up to 200 messages by id
+FETCH_SIZE = 200
+
+async def fetch_messages(client, channel_id: int, message_ids: List[int]) -> List:
+    while True:
+        try:
+            return await client.get_messages(channel_id, message_ids)
+        except FloodWait as e:
+            await asyncio.sleep(e.value)
+
+async def index_channel(client, channel_id: int, top_id: Optional[int] = None,
+                        on_progress: Optional[Callable[[Dict], Awaitable]] = None) -> Dict:
+    """Index a channel from its checkpoint up to `top_id`, oldest message first.
+    Without `top_id`, stops at the newest post seen by earlier runs or live indexing."""
+    _running.add(channel_id)
+    try:
+        async with _workers:
+            return await _index_channel(client, channel_id, top_id, on_progress)
+    finally:
+        _running.discard(channel_id)
+
+async def _index_channel(client, channel_id, top_id, on_progress):
+    start_id, known_top = await get_checkpoint(channel_id)
+    top_id = max(top_id or 0, known_top)
+    if not top_id:
+        raise ValueError("last message id unknown; pass it or forward the channel's last post")
+    await save_top(channel_id, top_id)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=INDEX_BATCH_SIZE * 2)
+
+    async def produce():
+        try:
+            for first in range(start_id + 1, top_id + 1, FETCH_SIZE):
+                ids = list(range(first, min(first + FETCH_SIZE, top_id + 1)))
+                for msg in await fetch_messages(client, channel_id, ids):
+                    await queue.put(msg)
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    buffer = FileWriteBuffer()
+    progress = {
+        "channel_id": channel_id, "scanned": 0, "files": 0, "rate": 0.0,
+        "eta": None, "last_message_id": start_id, "top_message_id": top_id
+    }
+    started = last_report = time.monotonic()
+
+    async def flush():
+        written = await buffer.flush()
+        await save_checkpoint(channel_id, progress["last_message_id"], written)
+        progress["files"] += written
+
+    try:
+        while True:
+            msg = await queue.get()
+            if msg is None:
+                break
+            if msg.id <= start_id:
+                continue
+
+            progress["scanned"] += 1
+            progress["last_message_id"] = msg.id
+            # Deleted or never-existing ids come back as empty messages
+            doc = None if msg.empty else build_file_doc(msg, channel_id)
+            if doc:
+                buffer.add(doc)
+            if buffer.full():
+                await flush()
+
+            now = time.monotonic()
+            if on_progress and now - last_report >= INDEX_PROGRESS_INTERVAL:
+                last_report = now
+                progress["rate"] = progress["scanned"] / (now - started)
+                remaining = max(top_id - msg.id, 0)
+                progress["eta"] = remaining / progress["rate"] if progress["rate"] else None
+                try:
+                    await on_progress(dict(progress))
+                except Exception:
+                    pass
+
+        await flush()
+        await producer
+    finally:
+        producer.cancel()
+
+    elapsed = time.monotonic() - started
+    progress["rate"] = progress["scanned"] / elapsed if elapsed else 0.0
+    progress["eta"] = 0
+    return progress
+
+# ==================== DELETES ====================
+async def remove_sources(chat_id: int, message_ids: Iterable[int],
+                         keep: Optional[Dict] = None) -> int:
+    """Forget deleted posts: drop them from their files' sources and delete
+    files left without any. Returns the number of files deleted."""
+    message_ids = list(message_ids)
+    gone = [{"chat_id": chat_id, "message_id": message_id} for message_id in message_ids]
+    query = {"$or": [
+        {"sources": {"$in": gone}},
+        # Files indexed before `sources` existed
+        {"chat_id": chat_id, "message_id": {"$in": message_ids}, "sources": {"$exists": False}}
+    ]}
+    if keep:
+        # An edit that kept its media stays attached to the same file
+        same = [{"file_unique_id": keep["file_unique_id"]}]
+        if keep.get("file_size"):
+            same.append({"file_size": keep["file_size"], "name_key": keep["name_key"]})
+        query["$nor"] = same
+
+    ops = []
+    file_terms = []
+    async for doc in database.files_col.find(query, {"sources": 1, "chat_id": 1,
+                                                     "message_id": 1, "terms": 1}):
+        file_terms.append(doc.get("terms", []))
+        sources = [s for s in doc.get("sources") or [database.source_of(doc)] if s not in gone]
+        if not sources:
+            ops.append(DeleteOne({"_id": doc["_id"]}))
+        else:
+            ops.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"sources": sources, **sources[0], "indexed_at": datetime.now()}}
+            ))
+    if not ops:
+        return 0
+
+    result = await database.files_col.bulk_write(ops, ordered=False)
+    if result.deleted_count:
+        await stats.incr("files", -result.deleted_count)
+    await result_cache.invalidate(file_terms)
+    return result.deleted_count
+
+# ==================== LIVE INDEXING ====================
+class LiveIndexer:
+    """Indexes new, edited and deleted posts of source channels as they arrive,
+    writing them in batches once the buffer fills or the interval passes"""
+
+    def __init__(self, batch_size: int = LIVE_INDEX_BATCH, interval: float = LIVE_INDEX_INTERVAL):
+        self.buffer = FileWriteBuffer(batch_size)
+        self.interval = interval
+        self.edited: List[Tuple[int, int, Dict]] = []
+        self.deleted: Set[Tuple[int, int]] = set()
+        self.indexed = 0
+        self.removed = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def pending(self) -> int:
+        return len(self.buffer) + len(self.deleted)
+
+    async def add(self, msg, chat_id: int, edited: bool = False) -> bool:
+        """Buffer a post's file; False if it carries none"""
+        doc = build_file_doc(msg, chat_id)
+        if doc is None:
+            return False
+        self.deleted.discard((chat_id, msg.id))
+        self.buffer.add(doc)
+        if edited:
+            # The edit may have replaced the media; detach the post from the old file
+            self.edited.append((chat_id, msg.id, doc))
+        if self.buffer.full():
+            await self.flush()
+        return True
+
+    async def remove(self, chat_id: int, message_ids: Iterable[int]):
+        """Forget deleted posts, including ones still waiting in the buffer"""
+        message_ids = set(message_ids)
+        self.buffer.docs = [
+            doc for doc in self.buffer.docs
+            if not (doc["chat_id"] == chat_id and doc["message_id"] in message_ids)
+        ]
+        self.deleted.update((chat_id, message_id) for message_id in message_ids)
+        if len(self.deleted) >= self.buffer.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            edited, self.edited = self.edited, []
+            deleted, self.deleted = self.deleted, set()
+            tops: Dict[int, int] = {}
+            for doc in self.buffer.docs:
+                tops[doc["chat_id"]] = max(tops.get(doc["chat_id"], 0), doc["message_id"])
+            self.indexed += await self.buffer.flush()
+            for chat_id, top_id in tops.items():
+                await save_top(chat_id, top_id)
+
+            by_chat: Dict[int, List[int]] = {}
+            for chat_id, message_id in deleted:
+                by_chat.setdefault(chat_id, []).append(message_id)
+            for chat_id, message_ids in by_chat.items():
+                self.removed += await remove_sources(chat_id, message_ids)
+            for chat_id, message_id, doc in edited:
+                self.removed += await remove_sources(chat_id, [message_id], keep=doc)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Live index flush failed")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+live = LiveIndexer()
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Tuple
+from pyrogram.errors import FloodWait
+from config import LOG_CHANNEL, LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL, LOG_DIGEST_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Digest headers per event kind
+HEADERS = {
+    "user": "👤 **{count} new users**",
+    "clone": "🌀 **{count} new clone bots**",
+    "slow_query": "🐢 **{count} slow queries**"
+}
+MAX_LINES = 20
+MAX_MESSAGE = 4000
+
+# ==================== SINK ====================
+class LogSink:
+    """Bounded buffer of log-channel events. Handlers only append; a background
+    flusher posts them as digests once enough pile up or the interval passes.
+    A full buffer drops events instead of slowing handlers down."""
+
+    def __init__(self, size: int = LOG_QUEUE_SIZE, interval: float = LOG_FLUSH_INTERVAL,
+                 digest_size: int = LOG_DIGEST_SIZE):
+        self.size = size
+        self.interval = interval
+        self.digest_size = digest_size
+        self.events: List[Tuple[str, str]] = []
+        self.dropped = 0
+        self.sent = 0
+        self.since = time.monotonic()
+        self._wake = asyncio.Event()
+        self._task = None
+        self._client = None
+
+    def emit(self, kind: str, line: str):
+        if not LOG_CHANNEL:
+            return
+        if len(self.events) >= self.size:
+            self.dropped += 1
+            return
+        self.events.append((kind, line))
+        if len(self.events) >= self.digest_size:
+            self._wake.set()
+
+    def digests(self, events: List[Tuple[str, str]], seconds: float) -> List[str]:
+        """Digest texts for a batch of events, split to fit Telegram's limit"""
+        by_kind: Dict[str, List[str]] = {}
+        for kind, line in events:
+            by_kind.setdefault(kind, []).append(line)
+
+        sections = []
+        for kind, lines in by_kind.items():
+            header = HEADERS.get(kind, f"📝 **{{count}} {kind} events**").format(count=len(lines))
+            body = "\n".join(f"• {line}" for line in lines[:MAX_LINES])
+            if len(lines) > MAX_LINES:
+                body += f"\n…and {len(lines) - MAX_LINES} more"
+            sections.append(f"{header} in the last {seconds:.0f}s\n{body}")
+        if self.dropped:
+            sections.append(f"⚠️ {self.dropped} events dropped so far")
+
+        texts = []
+        for section in sections:
+            section = section[:MAX_MESSAGE]
+            if texts and len(texts[-1]) + len(section) + 2 <= MAX_MESSAGE:
+                texts[-1] += "\n\n" + section
+            else:
+                texts.append(section)
+        return texts
+
+    async def flush(self):
+        events, self.events = self.events, []
+        now = time.monotonic()
+        seconds, self.since = now - self.since, now
+        if not events or self._client is None:
+            return
+        for text in self.digests(events, seconds):
+            try:
+                await self._client.send_message(LOG_CHANNEL, text)
+                self.sent += 1
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+                await self._client.send_message(LOG_CHANNEL, text)
+                self.sent += 1
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Log channel digest failed")
+
+    def start(self, client):
+        self._client = client
+        self.since = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Log channel digest failed")
+
+sink = LogSink()
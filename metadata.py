@@ -0,0 +1,142 @@
+import re
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import UpdateOne
+from motor.motor_asyncio import AsyncIOMotorCollection
+from search import build_terms, normalize
+from cache import result_cache
+
+# ==================== PATTERNS ====================
+SEASON_RE = re.compile(r"(?<![a-z0-9])(?:s|season[ ._-]?)(\d{1,2})(?:[ ._-]?e(?:p|pisode)?[ ._-]?(\d{1,3}))?(?![0-9])")
+EPISODE_RE = re.compile(r"(?<![a-z0-9])(?:e|ep|episode)[ ._-]?(\d{1,3})(?![0-9])")
+QUALITY_RE = re.compile(r"(?<![0-9])(2160|1440|1080|720|576|480|360|240)p|(?<![a-z0-9])(4k|uhd)(?![a-z0-9])")
+CODEC_RE = re.compile(r"(?<![a-z0-9])(x264|x265|h[ .]?264|h[ .]?265|hevc|avc|av1|xvid)(?![a-z0-9])")
+YEAR_RE = re.compile(r"(?<![0-9])(19[3-9]\d|20[0-4]\d)(?![0-9])")
+TOKEN_RE = re.compile(r"[a-z]+")
+
+CODECS = {
+    "x264": "x264", "h264": "x264", "h 264": "x264", "h.264": "x264", "avc": "x264",
+    "x265": "x265", "h265": "x265", "h 265": "x265", "h.265": "x265", "hevc": "x265",
+    "av1": "av1", "xvid": "xvid"
+}
+LANGUAGES = {
+    "hindi": "hindi", "hin": "hindi",
+    "english": "english", "eng": "english",
+    "tamil": "tamil", "tam": "tamil",
+    "telugu": "telugu", "tel": "telugu",
+    "malayalam": "malayalam", "mal": "malayalam",
+    "kannada": "kannada", "kan": "kannada",
+    "bengali": "bengali", "marathi": "marathi", "punjabi": "punjabi",
+    "korean": "korean", "kor": "korean",
+    "japanese": "japanese", "jap": "japanese",
+    "spanish": "spanish", "french": "french",
+    "dual": "dual", "multi": "multi"
+}
+
+# Release tags that mark the end of a title in a filename
+NOISE = {
+    "bluray", "brrip", "bdrip", "webrip", "web", "dl", "webdl", "hdrip", "dvdrip",
+    "dvdscr", "hdtv", "hdcam", "camrip", "cam", "hdts", "predvd", "x264", "x265",
+    "hevc", "avc", "h264", "h265", "av1", "xvid", "aac", "ac3", "dd5", "ddp5", "atmos",
+    "esub", "esubs", "msub", "msubs", "sub", "subs", "dual", "multi", "audio", "mkv",
+    "mp4", "avi", "proper", "repack", "extended", "unrated", "uncut", "remastered",
+    "10bit", "8bit", "hq", "hd", "uhd", "4k", "hdr", "org", "amzn", "nf", "dsnp",
+    "hotstar", "zee5", "complete"
+}
+MARKER_RE = re.compile(r"^(?:s\d{1,2}(?:e\d{1,3})?|e\d{1,3}|ep\d{1,3}|season|episode|\d{3,4}p|(?:19|20)\d{2})$")
+
+# ==================== PARSER ====================
+def parse_metadata(filename: Optional[str]) -> Dict:
+    """Parse season, episode, quality, codec, language and year from a filename"""
+    name = (filename or "").lower()
+
+    season = episode = None
+    season_match = SEASON_RE.search(name)
+    if season_match:
+        season = f"S{season_match.group(1).zfill(2)}"
+        if season_match.group(2):
+            episode = int(season_match.group(2))
+    if episode is None:
+        episode_match = EPISODE_RE.search(name)
+        if episode_match:
+            episode = int(episode_match.group(1))
+
+    quality = None
+    quality_match = QUALITY_RE.search(name)
+    if quality_match:
+        quality = f"{quality_match.group(1)}p" if quality_match.group(1) else "2160p"
+
+    codec_match = CODEC_RE.search(name)
+    codec = CODECS.get(codec_match.group(1)) if codec_match else None
+
+    languages: List[str] = []
+    for token in TOKEN_RE.findall(name):
+        language = LANGUAGES.get(token)
+        if language and language not in languages:
+            languages.append(language)
+
+    # Last year wins: "2001 a space odyssey 1968" is from 1968
+    years = YEAR_RE.findall(name)
+
+    return {
+        "season": season,
+        "episode": episode,
+        "quality": quality,
+        "codec": codec,
+        "language": languages,
+        "year": int(years[-1]) if years else None
+    }
+
+def clean_title(filename: Optional[str]) -> str:
+    """Normalized title: the filename up to its first season/year/release tag"""
+    tokens = normalize(filename).split()
+    title = []
+    for token in tokens:
+        # A leading year is part of the title: "1917", "2001 a space odyssey"
+        if title and (MARKER_RE.match(token) or token in NOISE or token in LANGUAGES):
+            break
+        title.append(token)
+    return " ".join(title or tokens)
+
+def file_fields(file_name: Optional[str], caption: Optional[str] = "") -> Dict:
+    """All fields derived from a file's name at index time"""
+    fields = parse_metadata(file_name)
+    fields["title"] = clean_title(file_name)
+    fields["terms"] = build_terms(file_name, caption)
+    return fields
+
+# ==================== BACKFILL ====================
+BACKFILL_BATCH = 1000
+
+async def backfill_metadata(col: AsyncIOMotorCollection) -> int:
+    """Derive search terms and metadata for files indexed before they existed"""
+    updated = 0
+    batch = []
+    cursor = col.find(
+        {"$or": [
+            {"terms": {"$exists": False}},
+            {"quality": {"$exists": False}},
+            {"title": {"$exists": False}}
+        ]},
+        {"file_name": 1, "caption": 1}
+    ).batch_size(BACKFILL_BATCH)
+
+    async def write(batch):
+        await col.bulk_write([op for op, _ in batch], ordered=False)
+        # Cached misses would keep the newly searchable files hidden
+        await result_cache.invalidate(terms for _, terms in batch)
+
+    async for doc in cursor:
+        fields = file_fields(doc.get("file_name"), doc.get("caption"))
+        batch.append((UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {**fields, "indexed_at": datetime.now()}}
+        ), fields["terms"]))
+        if len(batch) >= BACKFILL_BATCH:
+            await write(batch)
+            updated += len(batch)
+            batch = []
+    if batch:
+        await write(batch)
+        updated += len(batch)
+    return updated
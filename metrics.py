@@ -0,0 +1,193 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+# ==================== REGISTRY ====================
+# A small Prometheus text-format registry; enough for counters, gauges and
+# histograms without pulling in prometheus_client. Updates may come from
+# driver threads (see dbmonitor), so each metric guards its series.
+REGISTRY: List["Metric"] = []
+
+def _labels(labels: Dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return "{" + inner + "}"
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> List[Tuple[str, Dict, float]]:
+        return []
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, dict(key), value) for key, value in self.values.items()]
+
+class Gauge(Metric):
+    """Gauge that is either set directly or read from a callback at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float] = None):
+        super().__init__(name, help)
+        self.fn = fn
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def samples(self):
+        return [(self.name, {}, self.fn() if self.fn else self.value)]
+
+class Histogram(Metric):
+    kind = "histogram"
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, help: str, buckets: Tuple = BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            series = [(key, list(counts), total, count)
+                      for key, (counts, total, count) in self.series.items()]
+        samples = []
+        for key, counts, total, count in series:
+            labels = dict(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", {**labels, "le": bound}, cumulative))
+            samples.append((f"{self.name}_bucket", {**labels, "le": "+Inf"}, count))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+def render() -> str:
+    """Every registered metric in Prometheus text format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+# ==================== EVENT LOOP LAG ====================
+LAG_INTERVAL = 0.5
+loop_lag = Gauge("event_loop_lag_seconds", "Delay of the last event loop wake-up")
+loop_lag_hist = Histogram(
+    "event_loop_lag", "Event loop wake-up delay in seconds",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+loop_heartbeat = 0.0
+
+async def monitor_loop_lag():
+    """Sleep a fixed interval and record how late the loop woke us"""
+    global loop_heartbeat
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(LAG_INTERVAL)
+        loop_heartbeat = time.monotonic()
+        lag = max(loop_heartbeat - started - LAG_INTERVAL, 0.0)
+        loop_lag.set(lag)
+        loop_lag_hist.observe(lag)
+
+# ==================== IN-FLIGHT HANDLERS ====================
+class Inflight:
+    """Counts running handlers so shutdown can wait for them"""
+
+    def __init__(self):
+        self.count = 0
+        self.accepting = True
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def enter(self):
+        self.count += 1
+        self._idle.clear()
+
+    def exit(self):
+        self.count -= 1
+        if self.count == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Stop accepting new handlers and wait for running ones to finish"""
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+inflight = Inflight()
+Gauge("handlers_in_flight", "Handlers currently running", lambda: inflight.count)
+
+# ==================== HANDLERS ====================
+handler_latency = Histogram("handler_latency_seconds", "Handler run time")
+handler_errors = Counter("handler_errors_total", "Exceptions raised by handlers")
+_branch: contextvars.ContextVar = contextvars.ContextVar("handler_branch", default=None)
+
+def set_branch(branch: str):
+    """Label the running handler's metrics with a sub-branch, e.g. a callback action"""
+    _branch.set(branch)
+
+def instrument(name: str):
+    """Wrap a Pyrogram handler to track it in flight and record latency and errors"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(client, update, *args, **kwargs):
+            # Draining for shutdown: drop new updates instead of starting work
+            if not inflight.accepting:
+                return
+            inflight.enter()
+            _branch.set(None)
+            started = time.perf_counter()
+            try:
+                return await func(client, update, *args, **kwargs)
+            except Exception as e:
+                handler_errors.inc(handler=name, branch=_branch.get() or "", error=type(e).__name__)
+                raise
+            finally:
+                handler_latency.observe(
+                    time.perf_counter() - started, handler=name, branch=_branch.get() or ""
+                )
+                inflight.exit()
+        return wrapper
+    return decorator
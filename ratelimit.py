@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from config import (
+    THROTTLE_USER_RATE, THROTTLE_USER_BURST, THROTTLE_CHAT_RATE, THROTTLE_CHAT_BURST,
+    THROTTLE_INLINE_RATE, THROTTLE_INLINE_BURST, THROTTLE_SEND_WAIT, THROTTLE_QUEUE, SEND_RATE
+)
+from cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# ==================== TOKEN BUCKET ====================
+class TokenBucket:
+    """Token bucket limiter; `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` can be taken"""
+        self._refill()
+        pause = max(self.paused_until - time.monotonic(), 0.0)
+        missing = max(tokens - self.tokens, 0.0)
+        return max(pause, missing / self.rate)
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        if self.wait_time(tokens) > 0:
+            return False
+        self.tokens -= tokens
+        return True
+
+    async def acquire(self, tokens: float = 1):
+        while True:
+            delay = self.wait_time(tokens)
+            if delay <= 0:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hold every taker back, e.g. for the duration of a FloodWait"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+# ==================== OUTGOING MESSAGES ====================
+# One bucket for broadcasts and file deliveries alike, so running both at
+# once still stays under the bot's global limit
+outgoing = TokenBucket(SEND_RATE)
+
+# ==================== USER / CHAT THROTTLE ====================
+SEND = "send"
+SEARCH = "search"
+# Inline queries arrive once per keystroke, so they get a bucket of their own
+INLINE = "inline"
+BUCKET_IDLE_TTL = 600
+BUCKET_CACHE_SIZE = 50000
+
+class Throttle:
+    """Per-user and per-chat token buckets in front of searches and deliveries.
+
+    Handlers never wait for a token: a search over the limit is dropped, and
+    a delivery over the limit is handed to a short per-user background queue.
+    Deliveries are favored: a search never takes a user's last token and
+    yields to that user's queued deliveries, and only searches count against
+    the chat."""
+
+    def __init__(self):
+        self.users = LRUCache(BUCKET_CACHE_SIZE, BUCKET_IDLE_TTL)
+        self.chats = LRUCache(BUCKET_CACHE_SIZE, BUCKET_IDLE_TTL)
+        self.inline = LRUCache(BUCKET_CACHE_SIZE, BUCKET_IDLE_TTL)
+        self.waiting: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self.queued: Counter = Counter()
+        self._tasks = set()
+
+    @staticmethod
+    def _bucket(cache: LRUCache, key: int, rate: float, burst: float) -> TokenBucket:
+        bucket = cache.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+        # Re-set on every use so active buckets don't expire
+        cache.set(key, bucket)
+        return bucket
+
+    def _takes(self, kind: str, user_id: int, chat_id: Optional[int]) -> List[Tuple[TokenBucket, float]]:
+        if kind == INLINE:
+            return [(self._bucket(self.inline, user_id, THROTTLE_INLINE_RATE, THROTTLE_INLINE_BURST), 1)]
+        user = self._bucket(self.users, user_id, THROTTLE_USER_RATE, THROTTLE_USER_BURST)
+        if kind == SEND:
+            return [(user, 1)]
+        # Keep one token back for file delivery
+        takes = [(user, min(2, user.capacity))]
+        if chat_id is not None and chat_id != user_id:
+            chat = self._bucket(self.chats, chat_id, THROTTLE_CHAT_RATE, THROTTLE_CHAT_BURST)
+            takes.append((chat, 1))
+        return takes
+
+    def _wait(self, kind: str, user_id: int, takes: List[Tuple[TokenBucket, float]]) -> float:
+        if kind == SEARCH and self.waiting[(SEND, user_id)]:
+            return 0.1
+        return max(bucket.wait_time(tokens) for bucket, tokens in takes)
+
+    @staticmethod
+    def _take(takes: List[Tuple[TokenBucket, float]]):
+        for bucket, _ in takes:
+            bucket.tokens -= 1
+
+    def admit(self, kind: str, user_id: int, chat_id: Optional[int] = None) -> bool:
+        """Take room for one request right away; False if over the limit"""
+        takes = self._takes(kind, user_id, chat_id)
+        if self._wait(kind, user_id, takes) > 0:
+            self.throttled[kind] += 1
+            return False
+        self._take(takes)
+        return True
+
+    def defer(self, user_id: int, job: Callable[[], Awaitable]) -> bool:
+        """Run a delivery in the background once the user has a token again;
+        False if the user's queue is full or the wait would be too long"""
+        takes = self._takes(SEND, user_id, None)
+        queue = (SEND, user_id)
+        if (self._wait(SEND, user_id, takes) > THROTTLE_SEND_WAIT
+                or self.waiting[queue] >= THROTTLE_QUEUE):
+            self.throttled[SEND] += 1
+            return False
+        self.queued[SEND] += 1
+        self.waiting[queue] += 1
+        task = asyncio.create_task(self._run_deferred(user_id, takes, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run_deferred(self, user_id: int, takes: List[Tuple[TokenBucket, float]],
+                            job: Callable[[], Awaitable]):
+        queue = (SEND, user_id)
+        deadline = time.monotonic() + THROTTLE_SEND_WAIT
+        try:
+            delay = self._wait(SEND, user_id, takes)
+            while delay > 0:
+                if time.monotonic() + delay > deadline:
+                    self.throttled[SEND] += 1
+                    return
+                await asyncio.sleep(delay)
+                delay = self._wait(SEND, user_id, takes)
+            self._take(takes)
+        finally:
+            self.waiting[queue] -= 1
+            if not self.waiting[queue]:
+                del self.waiting[queue]
+        try:
+            await job()
+        except Exception:
+            logger.exception("Deferred delivery to %s failed", user_id)
+
+    def stats(self) -> Dict:
+        return {
+            "throttled_searches": self.throttled[SEARCH],
+            "throttled_sends": self.throttled[SEND],
+            "throttled_inline": self.throttled[INLINE],
+            "queued": sum(self.queued.values()),
+            "waiting": sum(self.waiting.values())
+        }
+
+throttle = Throttle()
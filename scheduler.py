@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pyrogram.errors import FloodWait
+from config import SCHEDULER_BATCH_WINDOW
+from database import scheduled_col
+
+logger = logging.getLogger(__name__)
+
+# Seconds before actions are tried again after a failed run, e.g. a Mongo blip
+RETRY_DELAY = 30
+
+# ==================== SCHEDULER ====================
+class Scheduler:
+    """Timed deletes/edits kept in a heap and persisted so they survive restarts"""
+
+    def __init__(self):
+        self._heap: List = []
+        self._clients: Dict[int, object] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def register_client(self, client):
+        """Run actions scheduled through a client, including ones left from its last run"""
+        self._clients[client.me.id] = client
+        async for doc in scheduled_col.find({"bot_id": client.me.id}, {"due_at": 1}):
+            heapq.heappush(self._heap, (doc["due_at"].timestamp(), doc["_id"]))
+        self._wakeup.set()
+
+    def unregister_client(self, client):
+        self._clients.pop(client.me.id, None)
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    async def _schedule(self, client, delay: float, doc: Dict):
+        due = time.time() + delay
+        doc.update({"bot_id": client.me.id, "due_at": datetime.fromtimestamp(due)})
+        result = await scheduled_col.insert_one(doc)
+        heapq.heappush(self._heap, (due, result.inserted_id))
+        self._wakeup.set()
+
+    async def delete_later(self, client, chat_id: int, message_ids: List[int], delay: float):
+        """Delete messages after `delay` seconds without holding the caller"""
+        await self._schedule(client, delay, {
+            "kind": "delete", "chat_id": chat_id, "message_ids": list(message_ids)
+        })
+
+    async def edit_later(self, client, chat_id: int, message_id: int, text: str, delay: float):
+        """Edit a message's text after `delay` seconds"""
+        await self._schedule(client, delay, {
+            "kind": "edit", "chat_id": chat_id, "message_ids": [message_id], "text": text
+        })
+
+    async def start(self):
+        """Start the timer loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Everything due now, plus whatever falls due within the batch window
+            cutoff = time.time() + SCHEDULER_BATCH_WINDOW
+            ids = []
+            while self._heap and self._heap[0][0] <= cutoff:
+                ids.append(heapq.heappop(self._heap)[1])
+            try:
+                await self._execute(ids)
+            except Exception:
+                logger.exception("Scheduled actions failed; retrying in %ss", RETRY_DELAY)
+                for action_id in ids:
+                    heapq.heappush(self._heap, (time.time() + RETRY_DELAY, action_id))
+
+    async def _execute(self, ids: List[ObjectId]):
+        docs = await scheduled_col.find({"_id": {"$in": ids}}).to_list(None)
+        deletes = defaultdict(set)
+        edits = []
+        for doc in docs:
+            if doc["kind"] == "delete":
+                deletes[(doc["bot_id"], doc["chat_id"])].update(doc["message_ids"])
+            else:
+                edits.append(doc)
+
+        retry = {}
+        for (bot_id, chat_id), message_ids in deletes.items():
+            client = self._clients.get(bot_id)
+            if client is None:
+                continue
+            try:
+                # One call per chat however many deletes fell due together
+                await client.delete_messages(chat_id, sorted(message_ids))
+            except FloodWait as e:
+                for doc in docs:
+                    if doc["bot_id"] == bot_id and doc["chat_id"] == chat_id and doc["kind"] == "delete":
+                        retry[doc["_id"]] = e.value
+            except Exception:
+                pass
+
+        for doc in edits:
+            client = self._clients.get(doc["bot_id"])
+            if client is None:
+                continue
+            try:
+                await client.edit_message_text(doc["chat_id"], doc["message_ids"][0], doc["text"])
+            except FloodWait as e:
+                retry[doc["_id"]] = e.value
+            except Exception:
+                pass
+
+        # Actions for clients that are not running stay persisted for their next start
+        done = [doc["_id"] for doc in docs if doc["bot_id"] in self._clients and doc["_id"] not in retry]
+        for action_id, wait in retry.items():
+            heapq.heappush(self._heap, (time.time() + wait, action_id))
+        if done:
+            await scheduled_col.delete_many({"_id": {"$in": done}})
+
+scheduler = Scheduler()
@@ -0,0 +1,128 @@
+import re
+from typing import List, Dict, Optional
+from pymongo import ASCENDING
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+# ==================== CONFIG ====================
+SEARCH_MODE_INDEX = "index"
+SEARCH_MODE_REGEX = "regex"
+SEARCH_MODE_MEMORY = "memory"
+CANDIDATE_LIMIT = 500
+# Fields needed to rank and render a result; keeps cached results small
+RESULT_PROJECTION = {
+    "file_id": 1, "file_name": 1, "chat_id": 1, "message_id": 1,
+    "season": 1, "episode": 1, "quality": 1
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# ==================== TOKENIZER ====================
+def normalize(text: Optional[str]) -> str:
+    """Lowercase text and collapse separators into single spaces"""
+    if not text:
+        return ""
+    return " ".join(TOKEN_RE.findall(text.lower()))
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into unique normalized terms, keeping first-seen order"""
+    terms = []
+    seen = set()
+    for token in normalize(text).split():
+        if token not in seen:
+            seen.add(token)
+            terms.append(token)
+    return terms
+
+def build_terms(file_name: Optional[str], caption: Optional[str] = "") -> List[str]:
+    """Terms stored on a file document for the inverted index"""
+    terms = tokenize(file_name)
+    seen = set(terms)
+    for token in tokenize(caption):
+        if token not in seen:
+            seen.add(token)
+            terms.append(token)
+    return terms
+
+# ==================== INDEXES ====================
+async def ensure_indexes(col: AsyncIOMotorCollection):
+    """Create the compound multikey index backing term and drill-down lookups"""
+    await col.create_index(
+        [("terms", ASCENDING), ("season", ASCENDING), ("quality", ASCENDING)],
+        name="terms_season_quality"
+    )
+    await col.create_index(
+        [("season", ASCENDING), ("episode", ASCENDING), ("quality", ASCENDING)],
+        name="season_episode_quality"
+    )
+    # Superseded by the compound index, which has `terms` as its prefix
+    if "terms_multikey" in await col.index_information():
+        await col.drop_index("terms_multikey")
+
+# ==================== RANKING ====================
+def score_file(file: Dict, query_terms: List[str], phrase: str) -> float:
+    """Relevance of a file for the query; file name hits outweigh caption hits"""
+    name = normalize(file.get("file_name"))
+    name_terms = name.split()
+    name_set = set(name_terms)
+
+    score = 0.0
+    for term in query_terms:
+        score += 3 if term in name_set else 1
+    if phrase and phrase in name:
+        score += 5
+    if name_terms and name_terms[0] == query_terms[0]:
+        score += 2
+    # Prefer tighter names: "avatar 2009" over "avatar making of featurette"
+    score -= 0.05 * max(len(name_terms) - len(query_terms), 0)
+    return score
+
+def rank_files(files: List[Dict], query: str) -> List[Dict]:
+    """Sort candidates by relevance, best first"""
+    query_terms = tokenize(query)
+    if not query_terms:
+        return files
+    phrase = " ".join(query_terms)
+    return sorted(
+        files,
+        key=lambda f: (-score_file(f, query_terms, phrase), f.get("file_name", ""))
+    )
+
+# ==================== SEARCH ====================
+def metadata_filter(season: Optional[str] = None, quality: Optional[str] = None) -> Dict:
+    """Exact-match filter on the fields parsed at index time"""
+    flt = {}
+    if season:
+        flt["season"] = season
+    if quality:
+        flt["quality"] = quality
+    return flt
+
+def index_filter(query: str) -> Optional[Dict]:
+    """Mongo filter intersecting every query term, or None for an empty query"""
+    query_terms = tokenize(query)
+    if not query_terms:
+        return None
+    # Longest term first: it is usually the most selective index bound
+    query_terms.sort(key=len, reverse=True)
+    return {"terms": {"$all": query_terms}}
+
+def regex_filter(query: str) -> Dict:
+    """Legacy substring filter; the query is escaped so it is never a pattern"""
+    return {"file_name": {"$regex": re.escape(query), "$options": "i"}}
+
+async def search_files(col: AsyncIOMotorCollection, query: str, limit: int = 100,
+                       mode: str = SEARCH_MODE_INDEX, season: Optional[str] = None,
+                       quality: Optional[str] = None) -> List[Dict]:
+    """Search the files collection and return ranked results"""
+    if mode == SEARCH_MODE_REGEX:
+        flt = {**regex_filter(query), **metadata_filter(season, quality)}
+        cursor = col.find(flt, RESULT_PROJECTION)
+        return await cursor.limit(limit).to_list(limit)
+
+    flt = index_filter(query)
+    if flt is None:
+        return []
+    flt.update(metadata_filter(season, quality))
+    cursor = col.find(flt, RESULT_PROJECTION)
+    candidates = await cursor.limit(CANDIDATE_LIMIT).to_list(CANDIDATE_LIMIT)
+    return rank_files(candidates, query)[:limit]
@@ -0,0 +1,93 @@
+import secrets
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from config import SNAPSHOT_TTL, CACHE_SIZE
+from cache import LRUCache
+from catalog import catalog
+from database import files_col, snapshots_col
+from search import RESULT_PROJECTION
+
+# ==================== RESULT SNAPSHOTS ====================
+# A search stores its ordered result ids once under a short id. Pagination
+# and drill-downs then read slices of that list instead of searching again,
+# so pages stay stable while new files are indexed. Snapshots made in this
+# process are also kept in memory, and with the in-memory catalog loaded a
+# page is served without touching Mongo.
+_local = LRUCache(CACHE_SIZE, SNAPSHOT_TTL)
+
+async def create_snapshot(query: str, results: List[Dict], season: Optional[str] = None,
+                          quality: Optional[str] = None) -> str:
+    """Store the ordered result ids of a search and return the snapshot id"""
+    snapshot_id = secrets.token_hex(8)
+    doc = {
+        "_id": snapshot_id,
+        "query": query,
+        "season": season,
+        "quality": quality,
+        "ids": [file["_id"] for file in results],
+        # Season and quality per id, so drill-downs never search again
+        "facets": [[file.get("season"), file.get("quality")] for file in results],
+        "total": len(results),
+        "expires_at": datetime.now() + timedelta(seconds=SNAPSHOT_TTL)
+    }
+    await snapshots_col.insert_one(doc)
+    _local.set(snapshot_id, doc)
+    return snapshot_id
+
+async def get_snapshot(snapshot_id: str) -> Optional[Dict]:
+    """Snapshot metadata without the id list, or None once expired"""
+    local = _local.get(snapshot_id)
+    if local is not None:
+        return {key: value for key, value in local.items() if key not in ("ids", "facets")}
+    return await snapshots_col.find_one(
+        {"_id": snapshot_id, "expires_at": {"$gt": datetime.now()}},
+        {"ids": 0, "facets": 0}
+    )
+
+async def narrow_snapshot(snapshot_id: str, season: Optional[str],
+                          quality: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+    """Child snapshot of a snapshot's files in one season and/or quality.
+    Returns the parent's metadata (None once expired) and the child id
+    (None if nothing matched)."""
+    parent = _local.get(snapshot_id)
+    if parent is None:
+        parent = await snapshots_col.find_one(
+            {"_id": snapshot_id, "expires_at": {"$gt": datetime.now()}}
+        )
+        if parent is None:
+            return None, None
+    files = [
+        {"_id": _id, "season": file_season, "quality": file_quality}
+        for _id, (file_season, file_quality) in zip(parent["ids"], parent.get("facets", []))
+        if (season is None or file_season == season)
+        and (quality is None or file_quality == quality)
+    ]
+    if not files:
+        return parent, None
+    return parent, await create_snapshot(parent["query"], files, season, quality)
+
+async def get_page(snapshot_id: str, page: int,
+                   per_page: int) -> Tuple[Optional[Dict], List[Dict]]:
+    """Load one page of a snapshot: its metadata and the files on that page"""
+    local = _local.get(snapshot_id)
+    if local is not None:
+        snapshot = {key: value for key, value in local.items() if key not in ("ids", "facets")}
+        ids = local["ids"][page * per_page:(page + 1) * per_page]
+    else:
+        snapshot = await snapshots_col.find_one(
+            {"_id": snapshot_id, "expires_at": {"$gt": datetime.now()}},
+            {"ids": {"$slice": [page * per_page, per_page]},
+             "query": 1, "season": 1, "quality": 1, "total": 1}
+        )
+        if snapshot is None:
+            return None, []
+        ids = snapshot.pop("ids")
+
+    if catalog.ready:
+        found = catalog.get_many(ids)
+    else:
+        found = {}
+        async for file in files_col.find({"_id": {"$in": ids}}, RESULT_PROJECTION):
+            found[file["_id"]] = file
+    # Keep snapshot order; files removed since the search are skipped
+    return snapshot, [found[_id] for _id in ids if _id in found]
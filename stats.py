@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from pymongo import UpdateOne
+from config import STATS_FLUSH_INTERVAL, STATS_RECONCILE_INTERVAL, STATS_AGGREGATE_INTERVAL
+from database import stats_col, query_stats_col, users_col, files_col
+from search import normalize
+
+logger = logging.getLogger(__name__)
+
+# ==================== SNAPSHOT ====================
+# Everything the Stats/Admin buttons show. Handlers read this dict; only the
+# background tasks below touch the database.
+snapshot: Dict = {
+    "users": 0,
+    "files": 0,
+    "files_per_channel": [],
+    "searches_per_hour": [],
+    "top_queries": [],
+    "active_today": 0,
+    "daily_active": [],
+    "aggregated_at": None
+}
+
+_pending_queries: Counter = Counter()
+_pending_hours: Counter = Counter()
+_active_day: Optional[str] = None
+_tasks = []
+# Figures aggregate() computes, shared with worker processes via stats_col
+AGGREGATE_FIELDS = ("files_per_channel", "searches_per_hour", "daily_active",
+                    "top_queries", "aggregated_at")
+
+def hour_key(when: datetime) -> str:
+    return when.strftime("%Y-%m-%dT%H")
+
+def day_key(when: datetime) -> str:
+    return when.strftime("%Y-%m-%d")
+
+# ==================== COUNTERS ====================
+async def incr(field: str, amount: int = 1):
+    """Bump a maintained counter (users/files) in memory and in Mongo"""
+    if not amount:
+        return
+    snapshot[field] += amount
+    await stats_col.update_one({"_id": "counters"}, {"$inc": {field: amount}}, upsert=True)
+
+async def record_active(day: str, count: int):
+    """Add users seen for the first time on a day to its daily-active count"""
+    global _active_day
+    if not count:
+        return
+    if day != _active_day:
+        _active_day = day
+        snapshot["active_today"] = 0
+    snapshot["active_today"] += count
+    await stats_col.update_one({"_id": f"day:{day}"}, {"$inc": {"active": count}}, upsert=True)
+
+def record_search(query: str, found: bool = True):
+    """Count a search; flushed to Mongo in the background. Every group
+    message is a search, so only queries that found files are kept by name."""
+    if found:
+        _pending_queries[normalize(query)] += 1
+    _pending_hours[hour_key(datetime.now())] += 1
+
+async def load_counters() -> bool:
+    """Read the shared counters other processes keep bumping"""
+    doc = await stats_col.find_one({"_id": "counters"})
+    if not (doc and "users" in doc and "files" in doc):
+        return False
+    snapshot["users"], snapshot["files"] = doc["users"], doc["files"]
+    return True
+
+async def reconcile():
+    """Reset counters to the collection sizes, correcting any drift"""
+    users = await users_col.estimated_document_count()
+    files = await files_col.estimated_document_count()
+    snapshot["users"], snapshot["files"] = users, files
+    await stats_col.update_one(
+        {"_id": "counters"},
+        {"$set": {"users": users, "files": files, "reconciled_at": datetime.now()}},
+        upsert=True
+    )
+
+async def flush_searches():
+    """Write buffered search counts as $inc updates"""
+    global _pending_queries, _pending_hours
+    queries, _pending_queries = _pending_queries, Counter()
+    hours, _pending_hours = _pending_hours, Counter()
+    now = datetime.now()
+    query_ops = [
+        UpdateOne({"_id": query}, {"$inc": {"count": count}, "$set": {"last_at": now}}, upsert=True)
+        for query, count in queries.items() if query
+    ]
+    hour_ops = [
+        UpdateOne({"_id": f"hour:{hour}"}, {"$inc": {"count": count}}, upsert=True)
+        for hour, count in hours.items()
+    ]
+    if query_ops:
+        await query_stats_col.bulk_write(query_ops, ordered=False)
+    if hour_ops:
+        await stats_col.bulk_write(hour_ops, ordered=False)
+
+async def aggregate():
+    """Recompute the heavier figures shown on the Stats page"""
+    global _active_day
+    snapshot["files_per_channel"] = await files_col.aggregate([
+        {"$group": {"_id": "$chat_id", "files": {"$sum": 1}}},
+        {"$sort": {"files": -1}},
+        {"$limit": 10}
+    ]).to_list(10)
+
+    since = hour_key(datetime.now() - timedelta(hours=23))
+    hours = await stats_col.find(
+        {"_id": {"$gte": f"hour:{since}"}}
+    ).sort("_id", 1).to_list(24)
+    snapshot["searches_per_hour"] = [(doc["_id"][5:], doc["count"]) for doc in hours]
+
+    since = day_key(datetime.now() - timedelta(days=6))
+    days = await stats_col.find(
+        {"_id": {"$gte": f"day:{since}", "$lte": f"day:{day_key(datetime.now())}"}}
+    ).sort("_id", 1).to_list(7)
+    snapshot["daily_active"] = [(doc["_id"][4:], doc["active"]) for doc in days]
+    _active_day = day_key(datetime.now())
+    snapshot["active_today"] = dict(snapshot["daily_active"]).get(_active_day, 0)
+
+    top = await query_stats_col.find().sort("count", -1).limit(10).to_list(10)
+    snapshot["top_queries"] = [(doc["_id"], doc["count"]) for doc in top]
+    snapshot["aggregated_at"] = datetime.now()
+
+    # Worker processes read this instead of aggregating themselves
+    await stats_col.replace_one(
+        {"_id": "aggregate"},
+        {field: snapshot[field] for field in AGGREGATE_FIELDS},
+        upsert=True
+    )
+
+async def load_shared():
+    """Pick up the counters and the leader's last aggregate"""
+    global _active_day
+    await load_counters()
+    doc = await stats_col.find_one({"_id": "aggregate"})
+    if doc:
+        snapshot["files_per_channel"] = doc["files_per_channel"]
+        snapshot["aggregated_at"] = doc["aggregated_at"]
+        # BSON stores the (key, count) pairs as lists
+        for field in ("searches_per_hour", "daily_active", "top_queries"):
+            snapshot[field] = [tuple(pair) for pair in doc[field]]
+        _active_day = day_key(datetime.now())
+        snapshot["active_today"] = dict(snapshot["daily_active"]).get(_active_day, 0)
+
+# ==================== BACKGROUND ====================
+async def _every(interval: float, job, immediate: bool = False):
+    if not immediate:
+        await asyncio.sleep(interval)
+    while True:
+        try:
+            await job()
+        except Exception:
+            logger.exception("Stats job %s failed", job.__name__)
+        await asyncio.sleep(interval)
+
+async def start(leader: bool = True):
+    """Load counters and start the background loops. Every process flushes
+    its searches; only the leader reconciles and aggregates, and the others
+    reload the counters and the leader's stored aggregate."""
+    if not await load_counters() and leader:
+        await reconcile()
+    _tasks.append(asyncio.create_task(_every(STATS_FLUSH_INTERVAL, flush_searches)))
+    if leader:
+        _tasks.extend([
+            asyncio.create_task(_every(STATS_RECONCILE_INTERVAL, reconcile)),
+            asyncio.create_task(_every(STATS_AGGREGATE_INTERVAL, aggregate, immediate=True)),
+        ])
+    else:
+        _tasks.append(asyncio.create_task(_every(STATS_FLUSH_INTERVAL, load_shared, immediate=True)))
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    _tasks.clear()
+    await flush_searches()
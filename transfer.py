@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import secrets
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+from bson import ObjectId, json_util
+from pymongo import ReplaceOne, UpdateOne
+from config import EXPORT_DIR, EXPORT_CHUNK_DOCS, EXPORT_BATCH_SIZE
+from metadata import file_fields
+import database
+import fuzzy
+import stats
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMAT_JSONL = "jsonl"
+FORMAT_MSGPACK = "msgpack"
+EXTENSIONS = {FORMAT_JSONL: "jsonl.gz", FORMAT_MSGPACK: "msgpack.gz"}
+# Recomputed on import by the current parser, so not worth shipping
+DERIVED_FIELDS = ("terms", "title", "season", "episode", "quality", "codec", "language", "year")
+WRITE_BATCH = 1000
+
+# ==================== ENCODING ====================
+# msgpack has no ObjectId or datetime; carry them as extension types
+EXT_OBJECT_ID = 1
+EXT_DATETIME = 2
+
+def _msgpack_default(value):
+    if isinstance(value, ObjectId):
+        return msgpack.ExtType(EXT_OBJECT_ID, value.binary)
+    if isinstance(value, datetime):
+        return msgpack.ExtType(EXT_DATETIME, value.isoformat().encode())
+    raise TypeError(f"Cannot pack {type(value).__name__}")
+
+def _msgpack_ext(code, data):
+    if code == EXT_OBJECT_ID:
+        return ObjectId(data)
+    if code == EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    return msgpack.ExtType(code, data)
+
+def encode(docs: List[Dict], fmt: str) -> bytes:
+    if fmt == FORMAT_MSGPACK:
+        return b"".join(msgpack.packb(doc, default=_msgpack_default) for doc in docs)
+    return "".join(json_util.dumps(doc) + "\n" for doc in docs).encode()
+
+def read_chunk(path: str, fmt: str) -> Iterator[Dict]:
+    with gzip.open(path, "rb") as f:
+        if fmt == FORMAT_MSGPACK:
+            yield from msgpack.Unpacker(f, ext_hook=_msgpack_ext, raw=False)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+
+def check_format(fmt: str):
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unknown format {fmt!r}")
+    if fmt == FORMAT_MSGPACK and msgpack is None:
+        raise RuntimeError("msgpack format needs `pip install msgpack`")
+
+# ==================== EXPORT ====================
+async def export_collection(col, out_dir: str, name: str, fmt: str,
+                            exclude: tuple = (), on_progress=None) -> List[Dict]:
+    """Stream a collection into gzip chunks of EXPORT_CHUNK_DOCS documents"""
+    projection = {field: 0 for field in exclude} or None
+    cursor = col.find({}, projection).batch_size(EXPORT_BATCH_SIZE)
+    chunks = []
+    handle = None
+    batch = []
+
+    async def write(batch):
+        # Encoding thousands of documents is CPU work; keep it off the loop too
+        await asyncio.to_thread(lambda: handle.write(encode(batch, fmt)))
+
+    async for doc in cursor:
+        if handle is None:
+            path = f"{name}-{len(chunks) + 1:05d}.{EXTENSIONS[fmt]}"
+            handle = await asyncio.to_thread(gzip.open, os.path.join(out_dir, path), "wb")
+            chunks.append({"collection": name, "file": path, "docs": 0})
+        batch.append(doc)
+        chunks[-1]["docs"] += 1
+        if len(batch) >= EXPORT_BATCH_SIZE or chunks[-1]["docs"] >= EXPORT_CHUNK_DOCS:
+            await write(batch)
+            batch = []
+        if chunks[-1]["docs"] >= EXPORT_CHUNK_DOCS:
+            await asyncio.to_thread(handle.close)
+            handle = None
+            if on_progress:
+                await on_progress(name, sum(chunk["docs"] for chunk in chunks))
+    if batch:
+        await write(batch)
+    if handle is not None:
+        await asyncio.to_thread(handle.close)
+    return chunks
+
+async def export_catalog(out_dir: Optional[str] = None, users: bool = False,
+                         fmt: str = FORMAT_JSONL,
+                         on_progress: Optional[Callable[[str, int], Awaitable]] = None) -> Dict:
+    """Export files (and optionally users) into a directory with a manifest"""
+    check_format(fmt)
+    export_id = datetime.now().strftime("%Y%m%d-%H%M%S-") + secrets.token_hex(2)
+    out_dir = out_dir or os.path.join(EXPORT_DIR, export_id)
+    os.makedirs(out_dir, exist_ok=True)
+
+    chunks = await export_collection(database.files_col, out_dir, "files", fmt,
+                                     DERIVED_FIELDS, on_progress)
+    if users:
+        chunks += await export_collection(database.users_col, out_dir, "users", fmt,
+                                          on_progress=on_progress)
+    manifest = {
+        "id": export_id,
+        "format": fmt,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "chunks": chunks
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return {"dir": out_dir, "files": sum(c["docs"] for c in chunks if c["collection"] == "files"),
+            "users": sum(c["docs"] for c in chunks if c["collection"] == "users"),
+            "chunks": len(chunks)}
+
+# ==================== IMPORT ====================
+def rebuild(doc: Dict, collection: str) -> Dict:
+    if collection == "files":
+        doc.update(file_fields(doc.get("file_name"), doc.get("caption")))
+        # Fresh stamp so in-memory catalogs pick the file up on their next poll
+        doc["indexed_at"] = datetime.now()
+    return doc
+
+def upsert_op(doc: Dict, collection: str):
+    """Upsert keyed the way each collection is deduplicated, so files or
+    users this database already holds under another _id are merged"""
+    if collection == "users":
+        fields = {k: v for k, v in doc.items() if k != "_id"}
+        return UpdateOne({"user_id": doc["user_id"]},
+                         {"$set": fields, "$setOnInsert": {"_id": doc["_id"]}}, upsert=True)
+    if not isinstance(doc.get("file_unique_id"), str):
+        # Files indexed before file_unique_id existed can only match themselves
+        return ReplaceOne({"_id": doc["_id"]}, doc, upsert=True)
+    # Same merge as database.save_files: the first copy keeps its location,
+    # every copy is added to `sources`
+    sources = doc.get("sources") or [database.source_of(doc)]
+    on_insert = {k: doc[k] for k in ("_id", *database.LOCATION_FIELDS) if k in doc}
+    fields = {k: v for k, v in doc.items()
+              if k not in on_insert and k not in ("file_unique_id", "sources")}
+    return UpdateOne(
+        {"file_unique_id": doc["file_unique_id"]},
+        {"$set": fields, "$setOnInsert": on_insert,
+         "$addToSet": {"sources": {"$each": sources}}},
+        upsert=True
+    )
+
+async def import_chunk(path: str, fmt: str, collection: str) -> int:
+    """Upsert one chunk in unordered bulk writes; safe to repeat"""
+    col = database.files_col if collection == "files" else database.users_col
+    docs = iter(read_chunk(path, fmt))
+    imported = 0
+    # Decoding, re-parsing names and building the ops all run in the thread
+    def next_ops():
+        return [upsert_op(rebuild(doc, collection), collection)
+                for _, doc in zip(range(WRITE_BATCH), docs)]
+
+    while True:
+        ops = await asyncio.to_thread(next_ops)
+        if not ops:
+            return imported
+        await col.bulk_write(ops, ordered=False)
+        imported += len(ops)
+
+async def import_catalog(in_dir: str,
+                         on_progress: Optional[Callable[[str, int], Awaitable]] = None) -> Dict:
+    """Load an export; chunks already imported into this database are skipped"""
+    with open(os.path.join(in_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    fmt = manifest["format"]
+    check_format(fmt)
+
+    report = {"files": 0, "users": 0, "skipped_chunks": 0}
+    for chunk in manifest["chunks"]:
+        state_id = f"{manifest['id']}:{chunk['file']}"
+        if await database.imports_col.find_one({"_id": state_id}):
+            report["skipped_chunks"] += 1
+            continue
+        report[chunk["collection"]] += await import_chunk(
+            os.path.join(in_dir, chunk["file"]), fmt, chunk["collection"]
+        )
+        await database.imports_col.insert_one({"_id": state_id, "docs": chunk["docs"],
+                                               "imported_at": datetime.now()})
+        if on_progress:
+            await on_progress(chunk["collection"], report[chunk["collection"]])
+
+    await database.ensure_indexes()
+    await stats.reconcile()
+    await fuzzy.rebuild_titles()
+    return report
+
+# ==================== CLI ====================
+async def main(args):
+    async def progress(collection: str, docs: int):
+        print(f"  {collection}: {docs} documents")
+
+    try:
+        if args.command == "export":
+            result = await export_catalog(args.out, args.users, args.format, progress)
+        else:
+            result = await import_catalog(args.dir, progress)
+        print(f"✅ {args.command.capitalize()} done: {result}")
+    finally:
+        database.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import the files catalog")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="stream files (and users) to chunks")
+    export_parser.add_argument("--out", help=f"output directory (default: {EXPORT_DIR}/<id>)")
+    export_parser.add_argument("--users", action="store_true", help="also export users")
+    export_parser.add_argument("--format", choices=sorted(EXTENSIONS), default=FORMAT_JSONL)
+    import_parser = commands.add_parser("import", help="load an export directory")
+    import_parser.add_argument("dir")
+    asyncio.run(main(parser.parse_args()))